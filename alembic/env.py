@@ -30,6 +30,7 @@ try:
     from app.models import file as _file  # noqa: F401
     from app.models import file_version as _file_version  # noqa: F401
     from app.models import job as _job  # noqa: F401
+    from app.models import analysis_cache as _analysis_cache  # noqa: F401
 except Exception as e:
     logger.error("Failed to import app config or Base metadata: %s", e)
     raise
@@ -0,0 +1,34 @@
+"""analysis cache
+
+Revision ID: 0002_analysis_cache
+Revises: 0001_initial
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002_analysis_cache"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "analysis_cache",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("cache_key", sa.String(length=64), nullable=False),
+        sa.Column("file_id", sa.Integer(), sa.ForeignKey("files.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("object_name", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_analysis_cache_user_key", "analysis_cache", ["user_id", "cache_key"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_analysis_cache_user_key", table_name="analysis_cache")
+    op.drop_table("analysis_cache")
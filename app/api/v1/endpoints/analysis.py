@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, UploadFile, File as FileParam, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File as FileParam, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.file import File as FileModel
+from app.models.file_version import FileVersion
+from app.models.job import Job, JobStatus
+from app.models.analysis_cache import AnalysisCache
 from app.services.minio_service import minio_service
 from app.services.analysis_service import analysis_service
-import json
+from app.services.analysis_cache_service import analysis_cache_service
+from app.services.loader_service import loader_service
+from app.services.profiling_service import DatasetProfile, profiling_service
+from app.services.dataset_service import ParquetSink, dataset_service
+from app.schemas.analysis import AnalysisQuery
+from app.tasks import process_full_analysis, queue_chart_rendering
+from typing import Any, Dict, Optional
 from io import BytesIO
-import pandas as pd
+import json
 import uuid
 import logging
 import traceback
@@ -17,9 +29,74 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/analysis", tags=["Data Analysis"])
 
+def _analysis_response(analysis_id: int, analysis_result: Dict[str, Any], charts_urls) -> Dict[str, Any]:
+    return {
+        "analysis_id": analysis_id,
+        "summary": analysis_result["summary"],
+        "charts_url": charts_urls,
+        "insights": analysis_result["summary"].get("insights", []),
+        "columns": analysis_result["columns"],
+        "sample_data": analysis_result["sample_data"],
+        "chart_specs": analysis_result.get("chart_specs", []),
+        "sheets": analysis_result.get("sheets")
+    }
+
+async def _invalidate_cache(db: AsyncSession, file_id: int):
+    """Forget cached results for an analysis whose report is about to change; the caller commits."""
+    await db.execute(delete(AnalysisCache).where(AnalysisCache.file_id == file_id))
+    analysis_cache_service.discard_file(file_id)
+
+async def _cached_analysis(db: AsyncSession, user_id: int, cache_key: str) -> Optional[Dict[str, Any]]:
+    """Look up a finished analysis in the in-process LRU, then in the persistent index."""
+    hit = analysis_cache_service.get(user_id, cache_key)
+    if hit is not None:
+        db_file = await db.get(FileModel, hit[0])
+        if db_file is None or db_file.object_name != hit[1]:
+            # Deleted, or its report was replaced (append, full analysis) by another process
+            analysis_cache_service.discard(user_id, cache_key)
+            hit = None
+    if hit is None:
+        result = await db.execute(
+            select(AnalysisCache, FileModel.object_name)
+            .join(FileModel, FileModel.id == AnalysisCache.file_id)
+            .where(AnalysisCache.user_id == user_id, AnalysisCache.cache_key == cache_key)
+            .order_by(AnalysisCache.id.desc())
+            .limit(1)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        entry, current_object = row
+        if entry.object_name != current_object:
+            await _invalidate_cache(db, entry.file_id)
+            await db.commit()
+            return None
+        stored = minio_service.download_file(entry.object_name)
+        if not stored:
+            return None
+        hit = (entry.file_id, entry.object_name, json.loads(stored))
+        analysis_cache_service.put(user_id, cache_key, *hit)
+    
+    analysis_id, _, analysis_result = hit
+    # Stored objects are reused; only the presigned URLs are fresh
+    charts_urls = [minio_service.get_presigned_url(o) for o in analysis_result.get("chart_objects", [])]
+    response = _analysis_response(analysis_id, analysis_result, charts_urls)
+    response["cached"] = True
+    return response
+
 @router.post("/upload", response_model=dict)
 async def analyze_dataset(
     file: UploadFile = FileParam(...),
+    mode: str = Query("full", pattern="^(full|stream|preview)$",
+                      description="stream: chunked out-of-core profiling; preview: summary of a row sample"),
+    corr_k: int = Query(settings.ANALYSIS_CORR_TOP_K, ge=1, le=100, description="Number of correlated pairs to report"),
+    corr_threshold: float = Query(settings.ANALYSIS_CORR_THRESHOLD, ge=0, le=1),
+    corr_method: str = Query(settings.ANALYSIS_CORR_METHOD, pattern="^(pearson|spearman)$"),
+    sample_rows: int = Query(settings.ANALYSIS_PREVIEW_ROWS, ge=100, le=1000000, description="Preview sample size"),
+    queue_full: bool = Query(False, description="Preview only: also run the full analysis in the background"),
+    chart_format: str = Query("png", alias="charts", pattern="^(png|spec|none)$",
+                              description="png: rendered images; spec: plotly figure JSON for client rendering"),
+    sheet: Optional[str] = Query(None, description="Excel worksheet to analyze (default: the first)"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -27,56 +104,258 @@ async def analyze_dataset(
     if not file.content_type or file.content_type not in ['text/csv', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet']:
         raise HTTPException(status_code=400, detail="Only CSV/Excel files supported")
     
-    content = await file.read()
-    if len(content) > 100 * 1024 * 1024:  # 100MB
-        raise HTTPException(status_code=400, detail="File too large")
+    file_type = 'text/csv' if file.content_type == 'text/csv' else 'excel'
+    sheets = None
+    if file_type == 'excel':
+        # Sheet names come from the workbook index; no cells are read here
+        try:
+            sheets = await run_in_threadpool(loader_service.excel_sheets, file.file)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid Excel file")
+        if sheet is not None and sheet not in sheets:
+            raise HTTPException(status_code=400, detail=f"Worksheet '{sheet}' not found")
+        sheet = sheet or sheets[0]
+    size = file.size or 0
+    if size > settings.ANALYSIS_MAX_BYTES and mode == "full":
+        mode = "stream"  # too large to load into one DataFrame
+    if mode == "preview":
+        if size > (settings.ANALYSIS_STREAM_MAX_BYTES if file_type == 'text/csv' else settings.ANALYSIS_MAX_BYTES):
+            raise HTTPException(status_code=400, detail="File too large")
+        if queue_full and size > settings.ANALYSIS_MAX_BYTES and corr_method != "pearson":
+            raise HTTPException(status_code=400, detail="Streaming analysis supports pearson correlations only")
+    elif mode == "stream":
+        if size > settings.ANALYSIS_STREAM_MAX_BYTES:
+            raise HTTPException(status_code=400, detail="File too large")
+        if corr_method != "pearson":
+            raise HTTPException(status_code=400, detail="Streaming analysis supports pearson correlations only")
+    else:
+        content = await file.read()
+        if len(content) > settings.ANALYSIS_MAX_BYTES:
+            raise HTTPException(status_code=400, detail="File too large")
+    
+    # Identical content and options return the stored result without re-analysis
+    options = {"file_type": file_type, "mode": mode, "corr_k": corr_k, "corr_threshold": corr_threshold,
+               "corr_method": corr_method, "charts": chart_format}
+    if mode == "preview":
+        options["sample_rows"] = sample_rows
+    if sheet is not None:
+        options["sheet"] = sheet
+    digest = await run_in_threadpool(analysis_cache_service.digest, file.file)
+    cache_key = analysis_cache_service.key(digest, options)
+    if not queue_full:
+        cached = await _cached_analysis(db, current_user.id, cache_key)
+        if cached is not None:
+            return cached
     
     try:
-        # Analyze dataset
-        file_type = 'text/csv' if file.content_type == 'text/csv' else 'excel'
-        analysis_result = analysis_service.analyze_dataset(content, file_type)
+        if mode == "preview":
+            # One streaming pass keeps a uniform sample; the summary is estimated from it
+            if file_type == 'text/csv':
+                df, total_rows = await run_in_threadpool(profiling_service.sample_csv, file.file, sample_rows)
+            else:
+                df, total_rows = await run_in_threadpool(profiling_service.sample_excel, file.file,
+                                                         sample_rows, sheet)
+            analysis_result = await run_in_threadpool(
+                analysis_service.analyze_sample, df, total_rows, corr_k, corr_threshold, corr_method
+            )
+            profile_bytes = dataset_file = None  # appends and queries need the full analysis
+        else:
+            # Analyze dataset, keeping mergeable aggregates for later appends
+            source = file.file if mode == "stream" else BytesIO(content)
+            analysis_result, profile_bytes, df, dataset_file = await run_in_threadpool(
+                analysis_service.analyze_source, source, file_type, mode == "stream",
+                corr_k, corr_threshold, corr_method, sheet
+            )
+        if sheets is not None:
+            analysis_result["sheets"] = sheets
+            analysis_result["summary"]["sheet"] = sheet
+        
+        charts = []
+        if df is not None and chart_format != "none":
+            charts = await run_in_threadpool(analysis_service.chart_data, df)
+        if chart_format == "spec":
+            # Client-rendered: no PNGs are drawn or uploaded
+            analysis_result["chart_specs"] = analysis_service.chart_specs(charts)
+            charts = []
+        for chart in charts:
+            chart["object_name"] = minio_service.new_object_name(f"analysis_{chart['kind']}.png")
+        if charts:
+            analysis_result["chart_objects"] = [c["object_name"] for c in charts]
+        # Charts render on the workers; their URLs resolve once the PNGs are uploaded
+        charts_urls = [minio_service.get_presigned_url(c["object_name"]) for c in charts]
         
         # Save analysis JSON
-        analysis_json = json.dumps(analysis_result, indent=2).encode('utf-8')
         filename = f"analysis_{uuid.uuid4().hex[:8]}.json"
-        object_name = minio_service.upload_file(
-            filename=filename,
-            file_content=analysis_json,
-            metadata={
-                'type': 'analysis_report',
-                'rows': analysis_result['summary']['rows'],
-                'user_id': str(current_user.id)
-            }
+        object_name, json_size = analysis_service.store_analysis(
+            analysis_result, profile_bytes, filename, current_user.id, dataset_file
         )
         
-        # Generate and save charts
-        if file_type == 'text/csv':  # Pandas can read from bytes for charts
-            df = pd.read_csv(BytesIO(content))
-            charts_urls = analysis_service.generate_charts(df, "")
-        else:
-            charts_urls = []
-        
         # Save dataset to DB
         db_file = FileModel(
             filename=filename,
             user_id=current_user.id,
             object_name=object_name,
             mime_type="application/json",
-            size_bytes=len(analysis_json)
+            size_bytes=json_size
         )
         db.add(db_file)
         await db.commit()
         await db.refresh(db_file)
+        if not queue_full:
+            db.add(AnalysisCache(user_id=current_user.id, cache_key=cache_key,
+                                 file_id=db_file.id, object_name=object_name))
+            await db.commit()
+            analysis_cache_service.put(current_user.id, cache_key, db_file.id, object_name, analysis_result)
         
-        return {
-            "analysis_id": db_file.id,
-            "summary": analysis_result["summary"],
-            "charts_url": charts_urls,
-            "insights": analysis_result["summary"].get("insights", []),
-            "columns": analysis_result["columns"],
-            "sample_data": analysis_result["sample_data"]
-        }
+        response = _analysis_response(db_file.id, analysis_result, charts_urls)
+        if charts:
+            charts_job_id = str(uuid.uuid4())
+            db.add(Job(id=charts_job_id, user_id=current_user.id, task_type="analysis_charts",
+                       status=JobStatus.PENDING))
+            await db.commit()
+            queue_chart_rendering(charts_job_id, charts)
+            response["charts_job_id"] = charts_job_id
+        if mode == "preview" and queue_full:
+            # Keep the raw upload for the worker; the full report replaces the preview when done
+            await file.seek(0)
+            source_object = minio_service.upload_stream(
+                filename=file.filename or "dataset",
+                stream=file.file,
+                metadata={'type': 'analysis_source', 'user_id': str(current_user.id)}
+            )
+            job_id = str(uuid.uuid4())
+            db.add(Job(id=job_id, user_id=current_user.id, task_type="analysis", status=JobStatus.PENDING))
+            await db.commit()
+            process_full_analysis.delay(
+                job_id, db_file.id, source_object, file_type, current_user.id,
+                corr_k, corr_threshold, corr_method, sheet
+            )
+            response["full_analysis_job_id"] = job_id
+        return response
         
     except Exception as e:
         logger.error("Analysis failed: %s\n%s", str(e), traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Status of a background full analysis or chart rendering job."""
+    job = await db.get(Job, job_id)
+    if not job or job.user_id != current_user.id or job.task_type not in ("analysis", "analysis_charts"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "status": job.status,
+        "result_url": job.result_url,
+        "error": job.error_message
+    }
+
+@router.post("/{analysis_id}/append", response_model=dict)
+async def append_to_analysis(
+    analysis_id: int,
+    file: UploadFile = FileParam(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Profile only the new rows and merge them into the stored aggregates."""
+    if file.content_type != 'text/csv':
+        raise HTTPException(status_code=400, detail="Only CSV files can be appended")
+    if (file.size or 0) > settings.ANALYSIS_STREAM_MAX_BYTES:
+        raise HTTPException(status_code=400, detail="File too large")
+    
+    result = await db.execute(
+        select(FileModel).where(FileModel.id == analysis_id, FileModel.user_id == current_user.id)
+    )
+    db_file = result.scalar_one_or_none()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    stored = minio_service.download_file(db_file.object_name)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Analysis not found in storage")
+    stored_result = json.loads(stored)
+    profile_object = stored_result.get("profile_object")
+    profile_bytes = minio_service.download_file(profile_object) if profile_object else None
+    if profile_bytes:
+        profile = DatasetProfile.from_bytes(profile_bytes)
+    elif stored_result.get("dataset_objects"):
+        # Full analyses store no profile; it is built from their Parquet rows on the first append
+        try:
+            profile = await run_in_threadpool(analysis_service.profile_dataset, stored_result["dataset_objects"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        raise HTTPException(status_code=409, detail="Analysis has no stored profile to append to")
+    previous_rows = profile.rows
+    # The new rows become one more Parquet part of the queryable dataset
+    sink = ParquetSink() if stored_result.get("dataset_objects") else None
+    try:
+        await run_in_threadpool(profiling_service.profile_csv, file.file, None, profile,
+                                sink.write if sink else None)
+        analysis_result = analysis_service.analyze_profile(profile)
+        profile_bytes = profile.to_bytes()
+    except ValueError as e:
+        dataset_file = sink.close() if sink else None
+        if dataset_file is not None:
+            dataset_file.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        profile.close()
+    
+    dataset_file = sink.close() if sink else None
+    if dataset_file is not None:
+        analysis_result["dataset_objects"] = stored_result["dataset_objects"]
+    # Otherwise the new rows did not fit the stored schema; the dataset would be incomplete
+    object_name, json_size = analysis_service.store_analysis(
+        analysis_result, profile_bytes, db_file.filename, current_user.id, dataset_file
+    )
+    
+    # Keep the previous report as a version of this analysis; cached copies of it are stale
+    await _invalidate_cache(db, db_file.id)
+    db.add(FileVersion(file_id=db_file.id, version=db_file.version or 1, object_name=db_file.object_name))
+    db_file.object_name = object_name
+    db_file.version = (db_file.version or 1) + 1
+    db_file.size_bytes = json_size
+    await db.commit()
+    
+    response = _analysis_response(db_file.id, analysis_result, [])
+    response["appended_rows"] = analysis_result["summary"]["rows"] - previous_rows
+    return response
+
+@router.post("/{analysis_id}/query", response_model=dict)
+async def query_analysis_dataset(
+    analysis_id: int,
+    query: AnalysisQuery,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Filter, group and aggregate the stored Parquet rows without re-uploading the dataset."""
+    result = await db.execute(
+        select(FileModel).where(FileModel.id == analysis_id, FileModel.user_id == current_user.id)
+    )
+    db_file = result.scalar_one_or_none()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    stored = minio_service.download_file(db_file.object_name)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Analysis not found in storage")
+    dataset_objects = json.loads(stored).get("dataset_objects")
+    if not dataset_objects:
+        raise HTTPException(status_code=409, detail="Analysis has no stored dataset to query")
+    
+    try:
+        return await run_in_threadpool(
+            dataset_service.query, dataset_objects,
+            [f.model_dump() for f in query.filters], query.group_by,
+            [a.model_dump() for a in query.aggregates], query.columns, query.limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Dataset query failed: %s\n%s", str(e), traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
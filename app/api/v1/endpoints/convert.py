@@ -1,5 +1,8 @@
 from fastapi import APIRouter, Depends, UploadFile, File as FileParam, HTTPException, Form
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
@@ -7,13 +10,40 @@ from app.models.file import File as FileModel
 from app.services.minio_service import minio_service
 from app.services.conversion_service import conversion_service
 from app.schemas.conversion import ConversionRequest
+from pydantic import ValidationError
+import asyncio
 import mimetypes
+import tempfile
+import threading
+import zipfile
 import uuid
-from typing import Dict, Any
+from typing import BinaryIO, Dict, List, Optional, Tuple
 import os
 
 router = APIRouter(prefix="/convert", tags=["File Conversions"])
 
+def _convert(source: BinaryIO, source_format: str, conversion: ConversionRequest) -> BinaryIO:
+    return conversion_service.convert_to_file(
+        source, source_format, conversion.target_format,
+        sheet=conversion.sheet,
+        max_dimension=conversion.max_dimension,
+        quality=conversion.quality,
+        effort=conversion.effort,
+        bitrate=conversion.bitrate,
+        sample_rate=conversion.sample_rate,
+        channels=conversion.channels
+    )
+
+def _store(output: BinaryIO, filename: str, metadata: Dict[str, str]) -> Tuple[str, int]:
+    """Stream a converted file to MinIO; returns its object name and size."""
+    output.seek(0, 2)
+    size_bytes = output.tell()
+    output.seek(0)
+    return minio_service.upload_stream(filename, output, size_bytes, metadata), size_bytes
+
+def _converted_name(filename: str, target_format: str) -> str:
+    return f"{os.path.splitext(filename)[0]}_converted.{target_format}"
+
 @router.post("/", response_model=dict)
 async def convert_file(
     conversion: str = Form(...),
@@ -21,48 +51,45 @@ async def convert_file(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    content = await file.read()
-    if len(content) > 50 * 1024 * 1024:  # 50MB
-        raise HTTPException(status_code=400, detail="File too large")
-    
     # Detect source format
     source_mime, _ = mimetypes.guess_type(file.filename)
-    source_format = file.content_type.split('/')[-1] if file.content_type else file.filename.split('.')[-1]
+    source_format = conversion_service.detect_format(file.content_type, file.filename)
     
     try:
         # parse conversion JSON from form field
         conversion_obj = ConversionRequest.parse_raw(conversion)
-
-        converted_content = conversion_service.convert_file(
-            file_content=content,
-            source_format=source_format,
-            target_format=conversion_obj.target_format
-        )
+        streaming = conversion_service.streaming_key(source_format, conversion_obj.target_format) is not None
         
         # Generate filename
-        name, ext = os.path.splitext(file.filename)
-        target_ext = f".{conversion_obj.target_format}"
-        new_filename = f"{name}_converted{target_ext}"
+        new_filename = _converted_name(file.filename, conversion_obj.target_format)
+        metadata = {
+            'operation': 'file_conversion',
+            'source': file.filename,
+            'target_format': conversion_obj.target_format,
+            'user_id': str(current_user.id)
+        }
         
-        # Save to MinIO
-        object_name = minio_service.upload_file(
-            filename=new_filename,
-            file_content=converted_content,
-            metadata={
-                'operation': 'file_conversion',
-                'source': file.filename,
-                'target_format': conversion_obj.target_format,
-                'user_id': str(current_user.id)
-            }
+        limit = settings.CONVERSION_STREAM_MAX_BYTES if streaming else settings.CONVERSION_MAX_BYTES
+        if (file.size or 0) > limit:
+            raise HTTPException(status_code=400, detail="File too large")
+        # Streamed pairs read the spooled upload in batches; the output is spooled too
+        output = await run_in_threadpool(
+            _convert, file.file, source_format, conversion_obj
         )
+        try:
+            object_name, size_bytes = await run_in_threadpool(_store, output, new_filename, metadata)
+        finally:
+            output.close()
         
         # Save metadata
         db_file = FileModel(
             filename=new_filename,
             user_id=current_user.id,
             object_name=object_name,
-            mime_type=f"application/{conversion_obj.target_format}" if conversion_obj.target_format != 'pdf' else 'application/pdf',
-            size_bytes=len(converted_content)
+            mime_type=conversion_service.MIME_TYPES.get(
+                conversion_obj.target_format, f"application/{conversion_obj.target_format}"
+            ),
+            size_bytes=size_bytes
         )
         db.add(db_file)
         await db.commit()
@@ -76,8 +103,160 @@ async def convert_file(
             "filename": new_filename,
             "source_format": source_format,
             "target_format": conversion_obj.target_format,
-            "size_bytes": len(converted_content)
+            "size_bytes": size_bytes
         }
         
+    except HTTPException:
+        raise
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
+
+
+@router.post("/batch", response_model=dict)
+async def convert_batch(
+    conversion: str = Form(...),
+    files: List[UploadFile] = FileParam(None),
+    file_ids: Optional[List[int]] = Form(None),
+    archive: bool = Form(False),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Convert uploads and stored files to one target format, a few at a time.
+
+    Each result is saved as its own file; a failed item is reported in ``items`` without
+    failing the others. ``archive=true`` also stores a ZIP of every converted file.
+    """
+    files = files or []
+    file_ids = file_ids or []
+    if not files and not file_ids:
+        raise HTTPException(status_code=400, detail="No files given")
+    if len(files) + len(file_ids) > settings.CONVERSION_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.CONVERSION_BATCH_MAX_FILES} files per batch"
+        )
+    try:
+        conversion_obj = ConversionRequest.parse_raw(conversion)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid conversion: {e}")
+    target = conversion_obj.target_format
+    
+    # (source name, content type, size, opener) per item, in request order. Uploads are
+    # read from their spooled files; stored files are downloaded when their turn comes
+    sources = [(f.filename, f.content_type, f.size, lambda f=f: f.file) for f in files]
+    if file_ids:
+        result = await db.execute(
+            select(FileModel).where(FileModel.id.in_(file_ids), FileModel.user_id == current_user.id)
+        )
+        stored = {f.id: f for f in result.scalars()}
+        for file_id in file_ids:
+            db_file = stored.get(file_id)
+            if db_file is None:
+                sources.append((f"file {file_id}", None, None, None))
+            else:
+                sources.append((db_file.filename, db_file.mime_type, db_file.size_bytes,
+                                lambda name=db_file.object_name: minio_service.download_stream(name)))
+    
+    semaphore = asyncio.Semaphore(settings.CONVERSION_BATCH_WORKERS)
+    
+    # Each result is written into the ZIP as soon as it is stored and then closed, so
+    # at most CONVERSION_BATCH_WORKERS outputs are open at a time
+    zipped = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES) if archive else None
+    zip_file = zipfile.ZipFile(zipped, 'w', allowZip64=True) if archive else None
+    zip_lock = threading.Lock()
+    zip_names: Dict[str, int] = {}
+    
+    def add_to_archive(filename: str, output: BinaryIO):
+        with zip_lock:
+            # Entry names must be unique; repeated source names get a counter
+            count = zip_names[filename] = zip_names.get(filename, 0) + 1
+            if count > 1:
+                base, ext = os.path.splitext(filename)
+                filename = f"{base} ({count}){ext}"
+            conversion_service.add_to_archive(zip_file, filename, output)
+    
+    def run(filename: str, source_format: str, open_source) -> Tuple[str, int]:
+        source = open_source()
+        if source is None:
+            raise FileNotFoundError("File not found in storage")
+        try:
+            output = _convert(source, source_format, conversion_obj)
+        finally:
+            if not any(source is f.file for f in files):
+                source.close()  # a downloaded copy
+        new_filename = _converted_name(filename, target)
+        try:
+            object_name, size_bytes = _store(output, new_filename, {
+                'operation': 'file_conversion',
+                'source': filename,
+                'target_format': target,
+                'user_id': str(current_user.id)
+            })
+            if zip_file is not None:
+                add_to_archive(new_filename, output)
+        finally:
+            output.close()
+        return object_name, size_bytes
+    
+    async def convert_one(filename: str, content_type: Optional[str], size: Optional[int], open_source):
+        if open_source is None:
+            return {"source": filename, "error": "File not found"}
+        source_format = conversion_service.detect_format(content_type, filename)
+        streaming = conversion_service.streaming_key(source_format, target) is not None
+        limit = settings.CONVERSION_STREAM_MAX_BYTES if streaming else settings.CONVERSION_MAX_BYTES
+        if (size or 0) > limit:
+            return {"source": filename, "error": "File too large"}
+        async with semaphore:
+            try:
+                object_name, size_bytes = await run_in_threadpool(run, filename, source_format, open_source)
+            except Exception as e:
+                return {"source": filename, "error": str(e) or type(e).__name__}
+        return {"source": filename, "filename": _converted_name(filename, target),
+                "object_name": object_name, "size_bytes": size_bytes}
+    
+    archive_info = None
+    try:
+        items = await asyncio.gather(*(convert_one(*source) for source in sources))
+        if zip_file is not None:
+            zip_file.close()  # writes the central directory
+            if zip_names:
+                object_name, size_bytes = await run_in_threadpool(_store, zipped, "converted.zip", {
+                    'operation': 'file_conversion_batch',
+                    'target_format': target,
+                    'user_id': str(current_user.id)
+                })
+                archive_info = {"filename": "converted.zip", "object_name": object_name, "size_bytes": size_bytes}
+    finally:
+        if zip_file is not None:
+            zip_file.close()
+            zipped.close()
+    
+    # One commit for every result row
+    rows = []
+    mime_type = conversion_service.MIME_TYPES.get(target, f"application/{target}")
+    for item in items:
+        if "error" not in item:
+            rows.append((item, FileModel(filename=item["filename"], user_id=current_user.id,
+                                         object_name=item["object_name"], mime_type=mime_type,
+                                         size_bytes=item["size_bytes"])))
+    if archive_info:
+        rows.append((archive_info, FileModel(filename="converted.zip", user_id=current_user.id,
+                                             object_name=archive_info["object_name"],
+                                             mime_type="application/zip",
+                                             size_bytes=archive_info["size_bytes"])))
+    db.add_all([db_file for _, db_file in rows])
+    await db.flush()
+    for info, db_file in rows:
+        info["converted_file_id"] = db_file.id
+        info["url"] = minio_service.get_presigned_url(info.pop("object_name"))
+    await db.commit()
+    
+    succeeded = sum("error" not in item for item in items)
+    return {
+        "target_format": target,
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "items": items,
+        "archive": archive_info
+    }
@@ -1,41 +1,89 @@
-from fastapi import APIRouter, Depends, UploadFile, File as FileParam, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File as FileParam, HTTPException, status, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.file import File as FileModel
 from app.services.minio_service import minio_service
 from app.services.pdf_service import pdf_service
+from app.schemas.pdf import PDFPages
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
+import img2pdf
+import os
+import tempfile
 
 router = APIRouter(prefix="/pdf", tags=["PDF Manipulation"])
 
 @router.post("/merge", response_model=dict)
 async def merge_pdfs(
-    files: List[UploadFile] = FileParam(...),
+    files: List[UploadFile] = FileParam(None),
+    file_ids: Optional[List[int]] = Form(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    if len(files) < 2:
+    """Merge uploads, then stored PDFs in ``file_ids`` order, into one PDF."""
+    files = files or []
+    file_ids = file_ids or []
+    if len(files) + len(file_ids) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 PDFs to merge")
+    if len(files) + len(file_ids) > settings.PDF_MERGE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.PDF_MERGE_MAX_FILES} PDFs per merge")
     
-    pdf_contents = []
+    total = 0
     for file in files:
         if not file.content_type == "application/pdf":
             raise HTTPException(status_code=400, detail=f"{file.filename} is not a PDF")
-        
-        content = await file.read()
-        pdf_contents.append(content)
+        total += file.size or 0
     
-    merged_pdf = pdf_service.merge_pdfs(pdf_contents)
+    object_names = []
+    if file_ids:
+        result = await db.execute(
+            select(FileModel).where(FileModel.id.in_(file_ids), FileModel.user_id == current_user.id)
+        )
+        stored = {f.id: f for f in result.scalars()}
+        for file_id in file_ids:
+            db_file = stored.get(file_id)
+            if db_file is None:
+                raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+            if db_file.mime_type != "application/pdf":
+                raise HTTPException(status_code=400, detail=f"{db_file.filename} is not a PDF")
+            total += db_file.size_bytes or 0
+            object_names.append(db_file.object_name)
+    if total > settings.PDF_MERGE_MAX_BYTES:
+        raise HTTPException(status_code=400, detail="PDFs too large")
     
-    # Save merged PDF to MinIO
-    object_name = minio_service.upload_file(
-        filename="merged.pdf",
-        file_content=merged_pdf,
-        metadata={"operation": "pdf_merge", "user_id": str(current_user.id)}
-    )
+    def inputs():
+        # Uploads are already spooled; stored PDFs are downloaded only when the merge reaches them
+        for file in files:
+            yield file.file
+        for object_name in object_names:
+            stream = minio_service.download_stream(object_name)
+            if stream is None:
+                raise FileNotFoundError(f"{object_name} not found in storage")
+            try:
+                yield stream
+            finally:
+                stream.close()
+    
+    try:
+        output, pages = await run_in_threadpool(pdf_service.merge_files, inputs())
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not merge: {e}")
+    try:
+        output.seek(0, 2)
+        size_bytes = output.tell()
+        output.seek(0)
+        object_name = await run_in_threadpool(
+            minio_service.upload_stream, "merged.pdf", output, size_bytes,
+            {"operation": "pdf_merge", "user_id": str(current_user.id)}
+        )
+    finally:
+        output.close()
     
     # Save metadata
     db_file = FileModel(
@@ -43,14 +91,14 @@ async def merge_pdfs(
         user_id=current_user.id,
         object_name=object_name,
         mime_type="application/pdf",
-        size_bytes=len(merged_pdf)
+        size_bytes=size_bytes
     )
     db.add(db_file)
     await db.commit()
     await db.refresh(db_file)
     
     url = minio_service.get_presigned_url(object_name)
-    return {"merged_file_id": db_file.id, "url": url, "filename": "merged.pdf"}
+    return {"merged_file_id": db_file.id, "url": url, "filename": "merged.pdf", "pages": pages}
 
 @router.post("/convert", response_model=dict)
 async def convert_to_pdf(
@@ -87,3 +135,168 @@ async def convert_to_pdf(
     await db.refresh(db_file)
     
     return {"pdf_file_id": db_file.id}
+
+@router.post("/images", response_model=dict)
+async def images_to_pdf(
+    files: List[UploadFile] = FileParam(None),
+    file_ids: Optional[List[int]] = Form(None),
+    page_size: str = Form("auto"),
+    fit: str = Form("into"),
+    margin_mm: float = Form(0, ge=0, le=100),
+    auto_orient: bool = Form(False),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """One PDF page per image: uploads first, then stored files in ``file_ids`` order."""
+    files = files or []
+    file_ids = file_ids or []
+    if not files and not file_ids:
+        raise HTTPException(status_code=400, detail="No images given")
+    if len(files) + len(file_ids) > settings.PDF_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.PDF_MAX_IMAGES} images per PDF")
+    if page_size not in pdf_service.PAGE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown page size: {page_size}")
+    if fit not in pdf_service.FIT_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown fit mode: {fit}")
+    
+    total = 0
+    images = []
+    for file in files:
+        if not (file.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"{file.filename} is not an image")
+        total += file.size or 0
+        images.append(file.file)  # img2pdf reads the spooled upload directly
+    
+    if file_ids:
+        result = await db.execute(
+            select(FileModel).where(FileModel.id.in_(file_ids), FileModel.user_id == current_user.id)
+        )
+        stored = {f.id: f for f in result.scalars()}
+        for file_id in file_ids:
+            db_file = stored.get(file_id)
+            if db_file is None:
+                raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+            if not (db_file.mime_type or "").startswith("image/"):
+                raise HTTPException(status_code=400, detail=f"{db_file.filename} is not an image")
+            total += db_file.size_bytes or 0
+        if total > settings.PDF_IMAGES_MAX_BYTES:
+            raise HTTPException(status_code=400, detail="Images too large")
+    elif total > settings.PDF_IMAGES_MAX_BYTES:
+        raise HTTPException(status_code=400, detail="Images too large")
+    
+    # The PDF is written to a spooled temp file and streamed to MinIO
+    output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+    downloads = []
+    try:
+        for file_id in file_ids:
+            # Stored images are copied to spooled temp files, not held as bytes
+            stream = await run_in_threadpool(minio_service.download_stream, stored[file_id].object_name)
+            if stream is None:
+                raise HTTPException(status_code=404, detail=f"File {file_id} not found in storage")
+            downloads.append(stream)
+            images.append(stream)
+        try:
+            pages = await run_in_threadpool(
+                pdf_service.images_to_pdf, images, output, page_size, fit, margin_mm, auto_orient
+            )
+        except (ValueError, img2pdf.ImageOpenError, img2pdf.PdfTooLargeError,
+                img2pdf.UnsupportedColorspaceError, img2pdf.JpegColorspaceError) as e:
+            raise HTTPException(status_code=400, detail=f"Could not build PDF: {e}")
+        del images
+        size_bytes = output.tell()
+        output.seek(0)
+        object_name = await run_in_threadpool(
+            minio_service.upload_stream, "images.pdf", output, size_bytes,
+            {"operation": "images_to_pdf", "user_id": str(current_user.id)}
+        )
+    finally:
+        output.close()
+        for stream in downloads:
+            stream.close()
+    
+    db_file = FileModel(
+        filename="images.pdf",
+        user_id=current_user.id,
+        object_name=object_name,
+        mime_type="application/pdf",
+        size_bytes=size_bytes
+    )
+    db.add(db_file)
+    await db.commit()
+    await db.refresh(db_file)
+    
+    url = minio_service.get_presigned_url(object_name)
+    return {"pdf_file_id": db_file.id, "url": url, "filename": "images.pdf", "pages": pages}
+
+
+@router.post("/{file_id}/pages", response_model=dict)
+async def page_operation(
+    file_id: int,
+    operation: PDFPages,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Split, extract, rotate, reorder or delete pages of a stored PDF into new PDF files."""
+    result = await db.execute(
+        select(FileModel).where(FileModel.id == file_id, FileModel.user_id == current_user.id)
+    )
+    source_file = result.scalar_one_or_none()
+    if source_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if source_file.mime_type != "application/pdf":
+        raise HTTPException(status_code=400, detail=f"{source_file.filename} is not a PDF")
+    
+    def run():
+        source = minio_service.download_stream(source_file.object_name)
+        if source is None:
+            raise FileNotFoundError("File not found in storage")
+        with source:
+            return pdf_service.page_operation(
+                source, operation.operation, operation.pages, operation.ranges,
+                operation.every, operation.order, operation.angle
+            )
+    
+    try:
+        outputs = await run_in_threadpool(run)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    stem = os.path.splitext(source_file.filename)[0]
+    documents = []
+    try:
+        for number, (output, pages) in enumerate(outputs, 1):
+            filename = (f"{stem}_part{number}.pdf" if operation.operation == "split"
+                        else f"{stem}_{operation.operation}.pdf")
+            output.seek(0, 2)
+            size_bytes = output.tell()
+            output.seek(0)
+            object_name = await run_in_threadpool(
+                minio_service.upload_stream, filename, output, size_bytes,
+                {"operation": f"pdf_{operation.operation}", "source": source_file.filename,
+                 "user_id": str(current_user.id)}
+            )
+            documents.append((FileModel(
+                filename=filename,
+                user_id=current_user.id,
+                object_name=object_name,
+                mime_type="application/pdf",
+                size_bytes=size_bytes
+            ), pages))
+    finally:
+        for output, _ in outputs:
+            output.close()
+    
+    # One commit for every new document
+    db.add_all([db_file for db_file, _ in documents])
+    await db.flush()
+    response = [{
+        "pdf_file_id": db_file.id,
+        "url": minio_service.get_presigned_url(db_file.object_name),
+        "filename": db_file.filename,
+        "pages": pages,
+        "size_bytes": db_file.size_bytes
+    } for db_file, pages in documents]
+    await db.commit()
+    return {"source_file_id": file_id, "operation": operation.operation, "documents": response}
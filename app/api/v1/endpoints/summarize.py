@@ -1,43 +1,134 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, WebSocket
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, WebSocket, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
-from app.models.job import Job
-from app.tasks import process_summarization
+from app.models.job import Job, JobStatus
+from app.services.minio_service import minio_service
+from app.services.summarization_service import SentenceChunker, summarization_service
+from app.tasks import process_summarization, queue_map_reduce_summarization, upload_summary
 from uuid import uuid4
+from typing import List, Optional
+import codecs
 import json
+import time
 
 router = APIRouter(prefix="/summarize", tags=["Summarization"])
 
+# In-process routing counters, exposed at GET /summarize/metrics
+_metrics = {"inline": 0, "queued": 0, "map_reduce": 0, "inline_seconds_total": 0.0}
+
+async def _create_job(db: AsyncSession, user_id: int, status: JobStatus = JobStatus.PENDING,
+                      job_id: Optional[str] = None, result_url: Optional[str] = None) -> str:
+    job_id = job_id or str(uuid4())
+    job = Job(
+        id=job_id,
+        user_id=user_id,
+        task_type="summarization",
+        status=status,
+        result_url=result_url
+    )
+    db.add(job)
+    await db.commit()
+    return job_id
+
+def _upload_chunks(chunks: List[str], user_id: int) -> List[str]:
+    return [
+        minio_service.upload_file(
+            filename="chunk.txt",
+            file_content=chunk.encode('utf-8'),
+            metadata={'type': 'summarization_chunk', 'user_id': str(user_id)}
+        )
+        for chunk in chunks
+    ]
+
+async def _spool_sentence_chunks(file: UploadFile, user_id: int) -> List[str]:
+    """Read the upload incrementally, split it into sentence-aligned chunks and store each one.
+
+    Tokenizing runs in the threadpool, and each chunk goes to MinIO as soon as it is complete,
+    so only one read's worth of text is held here. Returns the chunks' object names in order.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    chunker = SentenceChunker(settings.SUMMARY_CHUNK_CHARS)
+    object_names = []
+    total_bytes = 0
+    try:
+        while data := await file.read(settings.SUMMARY_STREAM_READ_BYTES):
+            total_bytes += len(data)
+            if total_bytes > settings.SUMMARY_STREAM_MAX_BYTES:
+                raise HTTPException(status_code=400, detail="File too large")
+            chunks = await run_in_threadpool(chunker.feed, decoder.decode(data))
+            object_names += await run_in_threadpool(_upload_chunks, chunks, user_id)
+        chunks = await run_in_threadpool(chunker.feed, decoder.decode(b'', final=True))
+        chunks += chunker.flush()
+        object_names += await run_in_threadpool(_upload_chunks, chunks, user_id)
+    except Exception:
+        for object_name in object_names:
+            await run_in_threadpool(minio_service.delete_file, object_name)
+        raise
+    return object_names
+
 @router.post("/", response_model=dict)
 async def summarize_text(
     file: UploadFile = File(...),
+    stream: bool = Query(False, description="Map-reduce mode for documents beyond the single-task limit"),
+    keywords: int = Query(0, ge=0, le=50, description="Number of keywords and keyphrases to extract"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    if stream:
+        chunk_objects = await _spool_sentence_chunks(file, current_user.id)
+        if not chunk_objects:
+            raise HTTPException(status_code=400, detail="Empty document")
+        
+        job_id = await _create_job(db, current_user.id)
+        
+        # Summarize chunks in parallel subtasks, then reduce; tasks get object names, not text
+        queue_map_reduce_summarization(job_id, chunk_objects, current_user.id, keywords)
+        _metrics["map_reduce"] += 1
+        
+        return {"job_id": job_id, "status": "queued", "chunks": len(chunk_objects)}
+    
     content = await file.read()
     text = content.decode('utf-8', errors='ignore')
     
-    if len(text) > 100000:  # 100k char limit
-        raise HTTPException(status_code=400, detail="Text too long")
+    if len(text) > settings.SUMMARY_MAX_CHARS:
+        raise HTTPException(status_code=400, detail="Text too long; retry with stream=true")
     
-    job_id = str(uuid4())
+    # Small inputs are cheaper to summarize than to queue
+    cost = summarization_service.estimate_cost(text)
+    if (cost["chars"] <= settings.SUMMARY_INLINE_MAX_CHARS
+            and cost["sentences"] <= settings.SUMMARY_INLINE_MAX_SENTENCES):
+        start = time.perf_counter()
+        result = await run_in_threadpool(summarization_service.summarize, text, 0.3, keywords)
+        _metrics["inline"] += 1
+        _metrics["inline_seconds_total"] += time.perf_counter() - start
+        
+        # Stored like a queued result, so GET /jobs/{id} works the same for both
+        job_id = str(uuid4())
+        result_url = await run_in_threadpool(upload_summary, job_id, result)
+        await _create_job(db, current_user.id, JobStatus.COMPLETED, job_id, result_url)
+        return {"job_id": job_id, "status": "completed", "result_url": result_url, **result}
     
     # Create job record
-    job = Job(
-        id=job_id,
-        user_id=current_user.id,
-        task_type="summarization"
-    )
-    db.add(job)
-    await db.commit()
+    job_id = await _create_job(db, current_user.id)
     
     # Queue background task
-    process_summarization.delay(job_id, text, current_user.id)
+    process_summarization.delay(job_id, text, current_user.id, keywords)
+    _metrics["queued"] += 1
     
     return {"job_id": job_id, "status": "queued"}
 
+@router.get("/metrics", response_model=dict)
+async def get_routing_metrics(current_user: User = Depends(get_current_user)):
+    return {
+        "inline_max_chars": settings.SUMMARY_INLINE_MAX_CHARS,
+        "inline_max_sentences": settings.SUMMARY_INLINE_MAX_SENTENCES,
+        **_metrics
+    }
+
 @router.get("/jobs/{job_id}", response_model=dict)
 async def get_job_status(
     job_id: str,
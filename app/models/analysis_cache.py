@@ -0,0 +1,14 @@
+from sqlalchemy import ForeignKey, Index, Integer, DateTime, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+
+class AnalysisCache(Base):
+    __tablename__ = "analysis_cache"
+    __table_args__ = (Index("ix_analysis_cache_user_key", "user_id", "cache_key"),)
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    cache_key: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256(content + options)
+    file_id: Mapped[int] = mapped_column(ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    object_name: Mapped[str] = mapped_column(String, nullable=False)  # report JSON at cache time
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,8 +1,26 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
 
 class AnalysisResponse(BaseModel):
     analysis_id: int
     summary: Dict[str, Any]
     charts_url: List[str]
     insights: List[str]
+
+class QueryFilter(BaseModel):
+    column: str
+    op: str = Field(..., pattern="^(==|!=|<|<=|>|>=|in|not_in|is_null|not_null)$")
+    value: Any = None
+
+class QueryAggregate(BaseModel):
+    column: str
+    func: str = Field(..., pattern="^(count|sum|mean|min|max|median|std|nunique|quantile)$")
+    q: float = Field(0.5, ge=0, le=1)  # quantile only
+    alias: Optional[str] = None
+
+class AnalysisQuery(BaseModel):
+    filters: List[QueryFilter] = []
+    group_by: List[str] = []
+    aggregates: List[QueryAggregate] = []
+    columns: List[str] = []  # projection when nothing is aggregated
+    limit: int = Field(1000, ge=1, le=10000)
@@ -1,7 +1,14 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 class ConversionRequest(BaseModel):
-    target_format: str = Field(..., pattern="^(xlsx|csv|pdf|mp3|png|jpg)$")
+    target_format: str = Field(..., pattern=r"^(xlsx|csv|pdf|mp3|png|jpg|jpeg|webp|bmp|tiff|gif|parquet|feather|arrow|csv\.gz|csv\.zst|wav|flac|ogg|opus|aac|m4a)$")
+    sheet: Optional[str] = None  # Excel sources: worksheet to convert (default: the first)
+    max_dimension: Optional[int] = Field(None, ge=1, le=20000)  # image targets: longest side in pixels
+    quality: Optional[int] = Field(None, ge=1, le=100)  # JPEG/WebP quality
+    effort: Optional[int] = Field(None, ge=0, le=9)  # encoder effort, 0 (fastest) to 9 (smallest)
+    bitrate: Optional[str] = Field(None, pattern=r"^\d{2,3}k$")  # lossy audio targets, e.g. "128k"
+    sample_rate: Optional[int] = Field(None, ge=8000, le=192000)  # audio targets: output rate in Hz
+    channels: Optional[int] = Field(None, ge=1, le=8)  # audio targets: 1 = mono, 2 = stereo
 
-SUPPORTED_FORMATS = ["csv", "xlsx", "pdf", "jpg", "png", "txt", "wav", "mp3"]
+SUPPORTED_FORMATS = ["csv", "xlsx", "pdf", "jpg", "png", "txt", "wav", "mp3", "parquet", "feather", "arrow", "csv.gz", "csv.zst", "webp", "bmp", "tiff", "gif", "flac", "ogg", "opus", "aac", "m4a"]
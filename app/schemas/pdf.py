@@ -1,8 +1,22 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 
 class PDFMerge(BaseModel):
     files: List[bytes]  # Handled via UploadFile
 
 class PDFConvert(BaseModel):
     pass  # Single file upload
+
+class PDFPages(BaseModel):
+    operation: str = Field(..., pattern="^(split|extract|rotate|reorder|delete)$")
+    pages: Optional[str] = None  # 1-based page spec such as "1-3,5,8-"; rotate defaults to every page
+    ranges: List[str] = []  # split: one page spec per output document
+    every: Optional[int] = Field(None, ge=1)  # split: documents of this many pages
+    order: List[int] = []  # reorder: every page number once, in the new order
+    angle: int = 90  # rotate: clockwise degrees
+    
+    @field_validator('angle')
+    def validate_angle(cls, v):
+        if v % 90:
+            raise ValueError('angle must be a multiple of 90')
+        return v
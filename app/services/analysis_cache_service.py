@@ -0,0 +1,62 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from app.core.config import settings
+
+class AnalysisCacheService:
+    """Hot tier of the analysis cache: an in-process LRU of finished results.
+
+    The persistent tier is the report JSON already stored in MinIO, indexed by the
+    analysis_cache table, so a miss here falls back to one lookup and one download.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # (user, key) -> (file id, report object name at cache time, result)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[int, str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(source: BinaryIO, block_size: int = 1024 * 1024) -> str:
+        """SHA-256 of an upload stream, leaving the stream rewound."""
+        sha = hashlib.sha256()
+        source.seek(0)
+        while block := source.read(block_size):
+            sha.update(block)
+        source.seek(0)
+        return sha.hexdigest()
+
+    @staticmethod
+    def key(digest: str, options: Dict[str, Any]) -> str:
+        """Cache key for content plus the options that change the result."""
+        return hashlib.sha256(
+            (digest + json.dumps(options, sort_keys=True)).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, user_id: int, key: str) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None:
+                self._entries.move_to_end((user_id, key))
+            return entry
+
+    def put(self, user_id: int, key: str, file_id: int, object_name: str, result: Dict[str, Any]):
+        with self._lock:
+            self._entries[(user_id, key)] = (file_id, object_name, result)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id: int, key: str):
+        with self._lock:
+            self._entries.pop((user_id, key), None)
+
+    def discard_file(self, file_id: int):
+        """Drop every entry for an analysis whose report was replaced."""
+        with self._lock:
+            for entry_key in [k for k, v in self._entries.items() if v[0] == file_id]:
+                del self._entries[entry_key]
+
+analysis_cache_service = AnalysisCacheService(settings.ANALYSIS_CACHE_SIZE)
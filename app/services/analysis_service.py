@@ -1,14 +1,22 @@
 import pandas as pd
 import numpy as np
 from io import BytesIO
-import matplotlib.pyplot as plt
+from statistics import NormalDist
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
-from scipy import stats
 import json
-from typing import Dict, List, Any
-import plotly.graph_objects as go
-import plotly.express as px
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 from app.services.minio_service import minio_service
+from app.core.config import settings
+from app.services.profiling_service import DatasetProfile, TopPairs, profiling_service
+from app.services.loader_service import TEXT_DTYPES, loader_service
+from app.services.dataset_service import ParquetSink, dataset_service
+
+try:
+    import pyarrow as pa
+except Exception:
+    pa = None
 
 class AnalysisService:
     @staticmethod
@@ -23,18 +31,30 @@ class AnalysisService:
             return float(obj)
         if isinstance(obj, (np.bool_,)):
             return bool(obj)
+        if obj is pd.NA:
+            return None
         return obj
 
     @staticmethod
-    def analyze_dataset(file_content: bytes, file_type: str) -> Dict[str, Any]:
-        """Comprehensive dataset analysis with stats and insights."""
+    def load_dataset(file_content: bytes, file_type: str, sheet: Optional[str] = None) -> pd.DataFrame:
+        """Parse an uploaded dataset once; the frame is shared by stats and charts."""
         if file_type == "text/csv":
-            df = pd.read_csv(BytesIO(file_content))
+            return loader_service.read_csv(file_content)
         elif "excel" in file_type:
-            df = pd.read_excel(BytesIO(file_content))
-        else:
-            raise ValueError("Unsupported format")
-        
+            return loader_service.read_excel(file_content, sheet=sheet)
+        raise ValueError("Unsupported format")
+
+    @staticmethod
+    def analyze_dataset(file_content: bytes, file_type: str) -> Dict[str, Any]:
+        """Comprehensive dataset analysis with stats and insights."""
+        df = AnalysisService.load_dataset(file_content, file_type)
+        return AnalysisService.analyze_frame(df)
+
+    @staticmethod
+    def analyze_frame(df: pd.DataFrame, corr_k: Optional[int] = None,
+                      corr_threshold: Optional[float] = None,
+                      corr_method: Optional[str] = None) -> Dict[str, Any]:
+        """Stats and insights for an already-loaded DataFrame."""
         # Basic statistics
         summary = {
             "rows": len(df),
@@ -43,37 +63,28 @@ class AnalysisService:
             "duplicate_rows": df.duplicated().sum(),
             "memory_usage_mb": df.memory_usage(deep=True).sum() / 1024**2
         }
+        if "memory_before_bytes" in df.attrs:
+            # Footprint the loader saved by choosing compact dtypes
+            summary["memory_usage_before_mb"] = df.attrs["memory_before_bytes"] / 1024**2
         
         # Numeric columns analysis
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         if len(numeric_cols) > 0:
-            summary["numeric_stats"] = {
-                col: {
-                    "mean": float(df[col].mean()),
-                    "std": float(df[col].std()),
-                    "min": float(df[col].min()),
-                    "max": float(df[col].max()),
-                    "skewness": float(stats.skew(df[col].dropna()))
-                } for col in numeric_cols
-            }
+            summary["numeric_stats"] = profiling_service.numeric_stats(df, numeric_cols.tolist())
         
         # Categorical analysis
-        cat_cols = df.select_dtypes(include=['object']).columns
+        cat_cols = df.select_dtypes(include=TEXT_DTYPES).columns
         if len(cat_cols) > 0:
-            summary["categorical_stats"] = {
-                col: {k: int(v) for k, v in df[col].value_counts().head(5).to_dict().items()}
-                for col in cat_cols
-            }
+            summary["categorical_stats"] = profiling_service.categorical_stats(df, cat_cols.tolist())
         
         # Correlations
         if len(numeric_cols) > 1:
-            corr_matrix = df[numeric_cols].corr()
-            summary["top_correlations"] = [
-                {"feature1": idx, "feature2": col, "correlation": float(corr_matrix.loc[idx, col])}
-                for idx in corr_matrix.columns 
-                for col in corr_matrix.columns 
-                if idx != col and abs(corr_matrix.loc[idx, col]) > 0.5
-            ][:5]
+            summary["top_correlations"] = profiling_service.top_correlations(
+                df, numeric_cols.tolist(),
+                k=corr_k or settings.ANALYSIS_CORR_TOP_K,
+                threshold=settings.ANALYSIS_CORR_THRESHOLD if corr_threshold is None else corr_threshold,
+                method=corr_method or settings.ANALYSIS_CORR_METHOD,
+            )
         
         # Generate insights
         insights = AnalysisService._generate_insights(df, summary)
@@ -87,13 +98,151 @@ class AnalysisService:
         }
         return AnalysisService._jsonable(result)
     
+    @staticmethod
+    def analyze_profile(profile: DatasetProfile, corr_k: Optional[int] = None,
+                        corr_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Build the analysis result from streamed (or resumed) profile aggregates.
+
+        Correlations come from streamed co-moments, so they are always Pearson, and cover
+        only the profile's ``pair_cols``.
+        """
+        summary = profile.summary()
+        if len(profile.pair_cols) > 1:
+            top = TopPairs(corr_k or settings.ANALYSIS_CORR_TOP_K,
+                           settings.ANALYSIS_CORR_THRESHOLD if corr_threshold is None else corr_threshold)
+            top.add(profile.correlation_matrix().to_numpy(), upper_only=True)
+            summary["top_correlations"] = top.to_list(profile.pair_cols)
+        summary["insights"] = AnalysisService._generate_insights(profile.sample, summary)
+        sample = profile.sample if profile.sample is not None else pd.DataFrame(columns=profile.columns)
+        result = {
+            "summary": summary,
+            "columns": profile.columns,
+            "sample_data": sample.where(pd.notnull(sample), None).to_dict(),
+        }
+        return AnalysisService._jsonable(result)
+
+    @staticmethod
+    def analyze_source(source: BinaryIO, file_type: str, stream: bool = False,
+                       corr_k: Optional[int] = None, corr_threshold: Optional[float] = None,
+                       corr_method: Optional[str] = None, sheet: Optional[str] = None
+                       ) -> Tuple[Dict[str, Any], bytes, Optional[pd.DataFrame], Optional[BinaryIO]]:
+        """Full analysis of an upload.
+
+        Returns (result, serialized profile or None, frame or None when streamed, Parquet copy
+        of the parsed rows or None without pyarrow). Only stream mode builds a profile; a full
+        analysis gets one from its stored rows on the first append (``profile_dataset``).
+        """
+        if stream:
+            # Profiles the source chunk by chunk in constant memory, writing Parquet as it goes
+            sink = ParquetSink() if pa is not None else None
+            on_chunk = sink.write if sink else None
+            if "excel" in file_type:
+                profile = profiling_service.profile_chunks(loader_service.iter_excel(source, sheet),
+                                                           on_chunk=on_chunk)
+            else:
+                profile = profiling_service.profile_csv(source, on_chunk=on_chunk)
+            try:
+                result = AnalysisService.analyze_profile(profile, corr_k, corr_threshold)
+                profile_bytes = profile.to_bytes()
+            finally:
+                profile.close()
+            return result, profile_bytes, None, sink.close() if sink else None
+        df = AnalysisService.load_dataset(source.read(), file_type, sheet)
+        result = AnalysisService.analyze_frame(df, corr_k, corr_threshold, corr_method)
+        dataset_file = dataset_service.write_frame(df) if pa is not None else None
+        return result, None, df, dataset_file
+
+    @staticmethod
+    def profile_dataset(dataset_objects: List[str]) -> DatasetProfile:
+        """Profile an analysis's stored Parquet rows, for the first append to a full analysis."""
+        profile = profiling_service.profile_chunks(dataset_service.iter_chunks(dataset_objects))
+        if profile is None:
+            raise ValueError("The stored dataset has no rows to append to")
+        return profile
+
+    @staticmethod
+    def analyze_sample(sample: pd.DataFrame, total_rows: int, corr_k: Optional[int] = None,
+                       corr_threshold: Optional[float] = None, corr_method: Optional[str] = None,
+                       confidence: Optional[float] = None) -> Dict[str, Any]:
+        """Analysis of a uniform row sample, with confidence intervals for the full dataset."""
+        confidence = confidence or settings.ANALYSIS_PREVIEW_CONFIDENCE
+        result = AnalysisService.analyze_frame(sample, corr_k, corr_threshold, corr_method)
+        summary = result["summary"]
+        n = len(sample)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        
+        def fpc(m: int) -> float:
+            # Finite population correction: the sample is drawn without replacement
+            population = total_rows * m / n if n else 0
+            return np.sqrt(max(population - m, 0) / (population - 1)) if population > 1 else 0.0
+        
+        for col, stats in summary.get("numeric_stats", {}).items():
+            m = int(sample[col].notna().sum())
+            if m > 1 and np.isfinite(stats["std"]):
+                half = z * stats["std"] / np.sqrt(m) * fpc(m)
+                stats["mean_ci"] = [stats["mean"] - half, stats["mean"] + half]
+        
+        proportions = {}
+        for col, counts in summary.get("categorical_stats", {}).items():
+            m = int(sample[col].notna().sum())
+            proportions[col] = {}
+            for value, count in counts.items():
+                # Wilson score interval stays inside [0, 1] for rare and common values
+                p = count / m
+                zz = (z * fpc(m)) ** 2
+                center = (p + zz / (2 * m)) / (1 + zz / m)
+                half = np.sqrt(p * (1 - p) / m * zz + zz * zz / (4 * m * m)) / (1 + zz / m)
+                proportions[col][value] = {"proportion": p, "ci": [max(center - half, 0.0), min(center + half, 1.0)]}
+        if proportions:
+            summary["categorical_proportions"] = proportions
+        
+        # Counts are scaled up to the full dataset; duplicates are only those seen in the sample
+        summary["rows"] = total_rows
+        if n:
+            summary["missing_values"] = int(round(summary["missing_values"] * total_rows / n))
+        summary["preview"] = {
+            "sample_rows": n,
+            "total_rows": total_rows,
+            "confidence": confidence,
+        }
+        summary["insights"] = AnalysisService._generate_insights(sample, summary)
+        return AnalysisService._jsonable(result)
+
+    @staticmethod
+    def store_analysis(result: Dict[str, Any], profile_bytes: Optional[bytes],
+                       filename: str, user_id: int,
+                       dataset_file: Optional[BinaryIO] = None) -> Tuple[str, int]:
+        """Save the analysis JSON and, when there are any, the profile and Parquet rows it points at."""
+        if dataset_file is not None:
+            result["dataset_objects"] = result.get("dataset_objects", []) + [
+                dataset_service.upload(dataset_file, user_id)
+            ]
+        if profile_bytes is not None:
+            result["profile_object"] = minio_service.upload_file(
+                filename=filename.replace(".json", ".profile.npz"),
+                file_content=profile_bytes,
+                metadata={'type': 'analysis_profile', 'user_id': str(user_id)}
+            )
+        analysis_json = json.dumps(result, indent=2).encode('utf-8')
+        object_name = minio_service.upload_file(
+            filename=filename,
+            file_content=analysis_json,
+            metadata={
+                'type': 'analysis_report',
+                'rows': result['summary']['rows'],
+                'user_id': str(user_id)
+            }
+        )
+        return object_name, len(analysis_json)
+
     @staticmethod
     def _generate_insights(df: pd.DataFrame, summary: Dict) -> List[str]:
         insights = []
         if summary["missing_values"] > 0:
             insights.append(f"Dataset has {summary['missing_values']} missing values")
         if summary["duplicate_rows"] > 0:
-            insights.append(f"Found {summary['duplicate_rows']} duplicate rows")
+            about = "about " if summary.get("duplicate_rows_estimated") else ""
+            insights.append(f"Found {about}{summary['duplicate_rows']} duplicate rows")
         if summary.get("numeric_stats"):
             for col, stats in summary["numeric_stats"].items():
                 if stats["skewness"] > 1:
@@ -101,48 +250,109 @@ class AnalysisService:
         return insights
     
     @staticmethod
-    def generate_charts(df: pd.DataFrame, output_dir: str) -> List[str]:
-        """Generate multiple chart types and save to MinIO."""
+    def chart_data(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Reduce the frame to small chart inputs: histogram bins and a bounded correlation matrix.
+
+        The heatmap covers at most ``ANALYSIS_HEATMAP_MAX_COLUMNS`` numeric columns, the ones
+        with the highest variance, so its cost and size do not grow with the column count.
+        """
         charts = []
-        
-        # Histogram for numeric columns
         numeric_cols = df.select_dtypes(include=[np.number]).columns
         if len(numeric_cols) > 0:
-            plt.figure(figsize=(10, 6))
-            for i, col in enumerate(numeric_cols[:4]):
-                plt.subplot(2, 2, i+1)
-                plt.hist(df[col].dropna(), bins=30, alpha=0.7)
-                plt.title(col)
-            plt.tight_layout()
-            chart_bytes = BytesIO()
-            plt.savefig(chart_bytes, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
-            chart_bytes.seek(0)
-            
-            object_name = minio_service.upload_file(
-                filename="analysis_histogram.png",
-                file_content=chart_bytes.read(),
-                metadata={'type': 'analysis_chart'}
-            )
-            charts.append(minio_service.get_presigned_url(object_name))
+            histograms = []
+            for col in numeric_cols[:4]:
+                values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                counts, edges = np.histogram(values[np.isfinite(values)], bins=30)
+                histograms.append({"column": str(col), "counts": counts.tolist(), "edges": edges.tolist()})
+            charts.append({
+                "kind": "histogram",
+                "data": {"columns": histograms},
+            })
         
-        # Correlation heatmap
         if len(numeric_cols) > 1:
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(df[numeric_cols].corr(), annot=True, cmap='coolwarm', center=0)
-            plt.title("Correlation Heatmap")
-            chart_bytes = BytesIO()
-            plt.savefig(chart_bytes, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
-            chart_bytes.seek(0)
-            
-            object_name = minio_service.upload_file(
-                filename="analysis_correlation.png",
-                file_content=chart_bytes.read(),
-                metadata={'type': 'analysis_chart'}
-            )
-            charts.append(minio_service.get_presigned_url(object_name))
-        
+            heatmap_cols = numeric_cols
+            if len(numeric_cols) > settings.ANALYSIS_HEATMAP_MAX_COLUMNS:
+                variances = df[numeric_cols].var()
+                heatmap_cols = variances.nlargest(settings.ANALYSIS_HEATMAP_MAX_COLUMNS).index
+                heatmap_cols = [c for c in numeric_cols if c in set(heatmap_cols)]  # keep frame order
+            corr = df[heatmap_cols].corr()
+            charts.append({
+                "kind": "correlation",
+                "data": {
+                    "columns": [str(c) for c in corr.columns],
+                    # Three decimals are plenty for a heatmap and keep task payloads small
+                    "matrix": corr.round(3).astype(object).where(corr.notna(), None).to_numpy().tolist(),
+                },
+            })
         return charts
 
+    @staticmethod
+    def chart_payload(chart: Dict[str, Any]) -> Dict[str, Any]:
+        """What a render task needs, with the heatmap cut to its bounded slice."""
+        data = chart["data"]
+        if chart["kind"] == "correlation":
+            n = settings.ANALYSIS_HEATMAP_MAX_COLUMNS
+            data = {"columns": data["columns"][:n], "matrix": [row[:n] for row in data["matrix"][:n]]}
+        return {"kind": chart["kind"], "data": data, "object_name": chart.get("object_name")}
+
+    @staticmethod
+    def chart_specs(charts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Plotly figure dicts for client-side rendering; nothing is drawn on the server."""
+        specs = []
+        for chart in map(AnalysisService.chart_payload, charts):
+            if chart["kind"] == "histogram":
+                for hist in chart["data"]["columns"]:
+                    edges = np.asarray(hist["edges"])
+                    specs.append({"kind": "histogram", "column": hist["column"], "figure": {
+                        "data": [{
+                            "type": "bar",
+                            "x": ((edges[:-1] + edges[1:]) / 2).tolist(),
+                            "y": hist["counts"],
+                            "width": np.diff(edges).tolist(),
+                            "opacity": 0.7,
+                        }],
+                        "layout": {"title": {"text": hist["column"]}, "bargap": 0},
+                    }})
+            elif chart["kind"] == "correlation":
+                columns = chart["data"]["columns"]
+                specs.append({"kind": "correlation", "figure": {
+                    "data": [{
+                        "type": "heatmap",
+                        "z": chart["data"]["matrix"],
+                        "x": columns,
+                        "y": columns,
+                        "colorscale": "RdBu",
+                        "reversescale": True,
+                        "zmid": 0,
+                        "texttemplate": "%{z:.2f}",
+                    }],
+                    "layout": {"title": {"text": "Correlation Heatmap"}, "yaxis": {"autorange": "reversed"}},
+                }})
+        return specs
+
+    @staticmethod
+    def render_chart(kind: str, data: Dict[str, Any]) -> bytes:
+        """Render one planned chart to PNG on its own Figure/Agg canvas (no pyplot state)."""
+        fig = Figure(figsize=(10, 6) if kind == "histogram" else (10, 8))
+        FigureCanvasAgg(fig)
+        if kind == "histogram":
+            for i, hist in enumerate(data["columns"]):
+                ax = fig.add_subplot(2, 2, i + 1)
+                edges = np.asarray(hist["edges"])
+                # Bars from precomputed bins look the same as hist() over the raw values
+                ax.hist(edges[:-1], bins=edges, weights=hist["counts"], alpha=0.7)
+                ax.set_title(hist["column"])
+            fig.tight_layout()
+        elif kind == "correlation":
+            ax = fig.add_subplot()
+            corr = pd.DataFrame(np.array(data["matrix"], dtype=np.float64),
+                                index=data["columns"], columns=data["columns"])
+            sns.heatmap(corr, annot=True, cmap='coolwarm', center=0, ax=ax)
+            ax.set_title("Correlation Heatmap")
+        else:
+            raise ValueError(f"Unknown chart kind: {kind}")
+        chart_bytes = BytesIO()
+        fig.savefig(chart_bytes, format='png', dpi=settings.ANALYSIS_CHART_DPI, bbox_inches='tight')
+        return chart_bytes.getvalue()
+
 analysis_service = AnalysisService()
@@ -4,19 +4,26 @@ import uuid
 from typing import Dict, List, Any
 from app.services.minio_service import minio_service
 from app.services.qr_service import qr_service
+from app.services.loader_service import loader_service
 import base64
 from io import BytesIO
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
 
 class ARMenuService:
+    @staticmethod
+    def _text(row: pd.Series, column: str, default: str = '') -> str:
+        """A cell as text; missing cells (NaN or Arrow-backed <NA>) give ``default``."""
+        value = row.get(column)
+        return default if value is None or pd.isna(value) else str(value)
+    
     @staticmethod
     def parse_menu_data(file_content: bytes, file_type: str) -> List[Dict]:
         """Parse CSV/JSON menu data into standardized format."""
         if file_type == "text/csv":
-            df = pd.read_csv(BytesIO(file_content))
+            df = loader_service.read_csv(file_content)
         elif file_type == "application/json":
-            df = pd.read_json(BytesIO(file_content))
+            df = loader_service.read_json(file_content)
         else:
             raise ValueError("Unsupported file type")
         
@@ -29,12 +36,12 @@ class ARMenuService:
         for _, row in df.iterrows():
             item = {
                 'id': str(uuid.uuid4()),
-                'name': str(row.get('name', '')),
-                'price': float(row.get('price', 0)),
-                'description': str(row.get('description', '')),
-                'category': str(row.get('category', 'main')),
-                'image_url': str(row.get('image_url', '')),
-                'ar_model': f"3d/{row.get('name', 'item')}.glb"  # Placeholder
+                'name': ARMenuService._text(row, 'name'),
+                'price': 0.0 if pd.isna(row.get('price')) else float(row.get('price')),
+                'description': ARMenuService._text(row, 'description'),
+                'category': ARMenuService._text(row, 'category', 'main'),
+                'image_url': ARMenuService._text(row, 'image_url'),
+                'ar_model': f"3d/{ARMenuService._text(row, 'name', 'item')}.glb"  # Placeholder
             }
             menu_items.append(item)
         
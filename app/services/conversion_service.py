@@ -1,91 +1,634 @@
 import pandas as pd
+import numpy as np
 from io import BytesIO
 import img2pdf
 import os
-from typing import Dict, Any
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+import xlsxwriter
+from PIL import Image, ImageOps, ImageSequence
+from typing import Dict, Any, BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
+from app.core.config import settings
+from app.services.loader_service import loader_service
+from app.services.pdf_service import pdf_service
+from app.services.profiling_service import as_text
 
 try:
-    from pydub import AudioSegment
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 except Exception:
-    AudioSegment = None
+    pa = None
+
+# Rows per worksheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+# Compressed CSV formats and their codec names
+CSV_CODECS = {'csv.gz': 'gzip', 'csv.zst': 'zstd'}
+
+# Block size for copying between pipes and files
+COPY_BYTES = 1024 * 1024
+
+class _KeepOpen:
+    """File proxy whose close() only flushes; wrapping streams close what they wrap."""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def close(self):
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return False
 
 class ConversionService:
     # Image formats that can be converted to PDF
     IMAGE_FORMATS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
+    # Pillow encoder per image target, and the modes each can store as they are
+    IMAGE_ENCODERS = {
+        'png': ('PNG', {'1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA'}),
+        'jpg': ('JPEG', {'L', 'RGB', 'CMYK'}),
+        'jpeg': ('JPEG', {'L', 'RGB', 'CMYK'}),
+        'webp': ('WEBP', {'RGB', 'RGBA'}),
+        'bmp': ('BMP', {'1', 'L', 'P', 'RGB'}),
+        'tiff': ('TIFF', {'1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA', 'CMYK'}),
+        'gif': ('GIF', {'L', 'P'}),
+    }
+    # MIME subtypes that name a format differently from its extension
+    FORMAT_ALIASES = {
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+        'excel': 'xlsx',
+        'vnd.apache.parquet': 'parquet',
+        'x-parquet': 'parquet',
+        'vnd.apache.arrow.file': 'arrow',
+        'mpeg': 'mp3',
+        'x-wav': 'wav',
+        'wave': 'wav',
+        'x-flac': 'flac',
+        'mp4': 'm4a',
+        'x-m4a': 'm4a',
+    }
+    # Subtypes that say nothing about the content; the file extension decides instead
+    GENERIC_SUBTYPES = {'octet-stream', 'gzip', 'x-gzip', 'zstd', 'zip'}
+    AUDIO_FORMATS = {'mp3', 'wav', 'flac', 'ogg', 'opus', 'aac', 'm4a', 'webm'}
+    # ffmpeg muxer and encoder per audio target; every muxer here can write to a pipe
+    AUDIO_ENCODERS = {
+        'mp3': ['-f', 'mp3', '-c:a', 'libmp3lame'],
+        'wav': ['-f', 'wav', '-c:a', 'pcm_s16le'],
+        'flac': ['-f', 'flac', '-c:a', 'flac'],
+        'ogg': ['-f', 'ogg', '-c:a', 'libvorbis'],
+        'opus': ['-f', 'opus', '-c:a', 'libopus'],
+        'aac': ['-f', 'adts', '-c:a', 'aac'],
+        'm4a': ['-f', 'ipod', '-c:a', 'aac', '-movflags', 'frag_keyframe+empty_moov'],
+    }
+    LOSSLESS_AUDIO = {'wav', 'flac'}
+    # Outputs that deflate cannot shrink further; stored as-is in archives
+    COMPRESSED_FORMATS = {'xlsx', 'parquet', 'csv.gz', 'csv.zst', 'pdf', 'png', 'jpg', 'jpeg', 'webp', 'gif',
+                          'mp3', 'ogg', 'opus', 'aac', 'm4a', 'flac'}
+    # Inputs whose index may sit at the end of the file; ffmpeg needs to seek, so not a pipe
+    SEEKABLE_AUDIO_INPUTS = {'m4a'}
+    # Formats converted row batch by row batch between each other (Feather v2 is Arrow IPC)
+    TABULAR_FORMATS = {'csv', 'xlsx', 'parquet', 'feather', 'arrow', 'csv.gz', 'csv.zst'}
+    MIME_TYPES = {
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'parquet': 'application/vnd.apache.parquet',
+        'feather': 'application/vnd.apache.arrow.file',
+        'arrow': 'application/vnd.apache.arrow.file',
+        'csv.gz': 'application/gzip',
+        'csv.zst': 'application/zstd',
+        'png': 'image/png',
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'webp': 'image/webp',
+        'bmp': 'image/bmp',
+        'tiff': 'image/tiff',
+        'gif': 'image/gif',
+        'mp3': 'audio/mpeg',
+        'wav': 'audio/wav',
+        'flac': 'audio/flac',
+        'ogg': 'audio/ogg',
+        'opus': 'audio/ogg',
+        'aac': 'audio/aac',
+        'm4a': 'audio/mp4',
+    }
     
     SUPPORTED_CONVERSIONS = {
-        'csv_to_excel': lambda data: ConversionService.csv_to_excel(data),
-        'csv_to_xlsx': lambda data: ConversionService.csv_to_excel(data),
-        'excel_to_csv': lambda data: ConversionService.excel_to_csv(data),
-        'xlsx_to_csv': lambda data: ConversionService.excel_to_csv(data),
-        'xls_to_csv': lambda data: ConversionService.excel_to_csv(data),
-        'image_to_pdf': lambda data: img2pdf.convert(data),
-        'txt_to_pdf': lambda data: ConversionService.txt_to_pdf(data),
-        'text_to_pdf': lambda data: ConversionService.txt_to_pdf(data),
-        'plain_to_pdf': lambda data: ConversionService.txt_to_pdf(data),
+        'csv_to_excel': lambda data, **opts: ConversionService.csv_to_excel(data),
+        'csv_to_xlsx': lambda data, **opts: ConversionService.csv_to_excel(data),
+        'excel_to_csv': lambda data, **opts: ConversionService.excel_to_csv(data, opts.get('sheet')),
+        'xlsx_to_csv': lambda data, **opts: ConversionService.excel_to_csv(data, opts.get('sheet')),
+        'xls_to_csv': lambda data, **opts: ConversionService.excel_to_csv(data, opts.get('sheet')),
+        'image_to_pdf': lambda data, **opts: img2pdf.convert(data),
+        'txt_to_pdf': lambda data, **opts: ConversionService.txt_to_pdf(data),
+        'text_to_pdf': lambda data, **opts: ConversionService.txt_to_pdf(data),
+        'plain_to_pdf': lambda data, **opts: ConversionService.txt_to_pdf(data),
     }
     
     @staticmethod
     def csv_to_excel(csv_bytes: bytes) -> bytes:
-        df = pd.read_csv(BytesIO(csv_bytes))
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-        return output.getvalue()
+        output = ConversionService.csv_to_excel_stream(BytesIO(csv_bytes))
+        try:
+            return output.read()
+        finally:
+            output.close()
+    
+    @staticmethod
+    def _excel_rows(chunk: pd.DataFrame) -> Iterator[Tuple[Any, ...]]:
+        """Rows of plain Python values; missing values become blank cells, infinities text."""
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        chunk = chunk.replace({np.inf: "inf", -np.inf: "-inf"})
+        return chunk.itertuples(index=False, name=None)
+    
+    @staticmethod
+    def csv_to_excel_stream(source: BinaryIO, chunk_rows: Optional[int] = None) -> BinaryIO:
+        """CSV to XLSX in constant memory; returns the workbook as a rewound spooled file."""
+        chunk_rows = chunk_rows or settings.CONVERSION_CHUNK_ROWS
+        return ConversionService._write_excel(
+            pd.read_csv(source, chunksize=chunk_rows, float_precision="round_trip")
+        )
     
     @staticmethod
-    def excel_to_csv(excel_bytes: bytes) -> bytes:
-        df = pd.read_excel(BytesIO(excel_bytes))
+    def _write_excel(chunks: Iterable[pd.DataFrame]) -> BinaryIO:
+        """Write DataFrame chunks to XLSX through xlsxwriter's constant_memory mode.
+
+        Each row is flushed to disk as it is written, and a new sheet is started whenever
+        one reaches Excel's row limit.
+        """
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            'remove_timezone': True,
+        })
+        # Same header look as DataFrame.to_excel
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        worksheet, columns, row = None, None, EXCEL_MAX_ROWS
+        try:
+            for chunk in chunks:
+                columns = [str(c) for c in chunk.columns]
+                for values in ConversionService._excel_rows(chunk):
+                    if row == EXCEL_MAX_ROWS:
+                        worksheet = workbook.add_worksheet(f"Sheet{len(workbook.worksheets()) + 1}")
+                        worksheet.write_row(0, 0, columns, header_format)
+                        row = 1
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+            if worksheet is None:
+                # Header-only input
+                worksheet = workbook.add_worksheet("Sheet1")
+                worksheet.write_row(0, 0, columns or [], header_format)
+        finally:
+            workbook.close()
+        output.seek(0)
+        return output
+    
+    @staticmethod
+    def excel_to_csv(excel_bytes: bytes, sheet: Optional[str] = None) -> bytes:
+        """Write one worksheet as CSV batch by batch; the sheet is never loaded whole."""
         output = BytesIO()
-        df.to_csv(output, index=False)
+        for i, batch in enumerate(loader_service.iter_excel(excel_bytes, sheet)):
+            ConversionService._whole_numbers(batch).to_csv(output, index=False, header=i == 0)
         return output.getvalue()
     
+    @staticmethod
+    def _whole_numbers(batch: pd.DataFrame) -> pd.DataFrame:
+        # Excel has no integer type; whole-number columns print without ".0"
+        # in every batch, not only in those without blanks
+        for col in batch.columns[batch.dtypes == float]:
+            values = batch[col].dropna()
+            if (values == values.round()).all():
+                batch[col] = batch[col].astype("Int64")
+        return batch
+    
     @staticmethod
     def txt_to_pdf(txt_bytes: bytes) -> bytes:
-        text = txt_bytes.decode('utf-8')
-        # Simple text to PDF (using reportlab or similar)
-        try:
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-        except Exception as exc:
-            raise ValueError("Text-to-PDF conversion is unavailable: install reportlab") from exc
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        y = height - 50
-        for line in text.split('\n'):
-            if y < 50:
-                p.showPage()
-                y = height - 50
-            p.drawString(50, y, line[:80])
-            y -= 14
-        p.save()
-        buffer.seek(0)
-        return buffer.read()
+        return pdf_service.text_to_pdf(txt_bytes)
     
     @staticmethod
-    def audio_to_mp3(audio_bytes: bytes, input_format: str) -> bytes:
-        if AudioSegment is None:
-            raise ValueError("Audio conversion is unavailable: install pydub and ffmpeg")
-        audio = AudioSegment.from_file(BytesIO(audio_bytes), format=input_format)
+    def _image_for(frame: Image.Image, target: str) -> Image.Image:
+        """Convert a frame to a mode the target stores, keeping alpha where it can."""
+        modes = ConversionService.IMAGE_ENCODERS[target][1]
+        # A transparency index or color in info survives only in PNG and GIF; elsewhere it
+        # has to become an alpha channel
+        keyed = 'transparency' in frame.info and target not in ('png', 'gif')
+        if frame.mode in modes and not keyed:
+            return frame
+        has_alpha = frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info
+        if target == 'gif':
+            # Palette with one transparent index
+            return frame.convert('RGBA' if has_alpha else 'RGB')
+        if has_alpha and frame.mode in ('L', 'LA') and 'LA' in modes:
+            return frame.convert('LA')
+        if has_alpha:
+            frame = frame.convert('RGBA')
+            if 'RGBA' in modes:
+                return frame
+            # No alpha channel in the target: flatten onto white
+            background = Image.new('RGB', frame.size, (255, 255, 255))
+            background.paste(frame, mask=frame.getchannel('A'))
+            return background
+        if frame.mode in ('LA', 'I', 'I;16', 'F') and 'L' in modes:
+            return frame.convert('L')
+        return frame.convert('RGB')
+    
+    @staticmethod
+    def _thumbnail(frame: Image.Image, max_dimension: int) -> Image.Image:
+        """Shrink a frame to fit ``max_dimension``, keeping its mode.
+
+        Lanczos does not take 16-bit grayscale, so those frames are resampled as 32-bit ``I``.
+        """
+        mode = frame.mode
+        if mode.startswith('I;16'):
+            frame = frame.convert('I')
+        frame.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+        return frame.convert(mode) if frame.mode != mode else frame
+    
+    @staticmethod
+    def transcode_image(image_bytes: bytes, target_format: str, max_dimension: Optional[int] = None,
+                        quality: Optional[int] = None, effort: Optional[int] = None) -> bytes:
+        """Re-encode an image, optionally shrinking it to fit ``max_dimension`` on its longest side.
+
+        Shrinking happens while decoding where the codec allows (JPEG DCT scaling), then by
+        integer reduction before the final Lanczos pass. ``quality`` (1-100) applies to JPEG
+        and WebP; ``effort`` (0-9) trades encode time for size in PNG, WebP, JPEG and GIF.
+        """
+        target = target_format.lower()
+        if target not in ConversionService.IMAGE_ENCODERS:
+            raise ValueError(f"Unsupported image format: {target_format}")
+        encoder = ConversionService.IMAGE_ENCODERS[target][0]
+        effort = settings.IMAGE_EFFORT if effort is None else effort
+        
+        img = Image.open(BytesIO(image_bytes))
+        frames, durations = [], []
+        animated = getattr(img, 'n_frames', 1) > 1 and target in ('gif', 'webp')
+        for frame in (ImageSequence.Iterator(img) if animated else [img]):
+            if not animated:
+                if max_dimension:
+                    # Before load(): lets JPEG decode at 1/2, 1/4 or 1/8 scale
+                    frame = ConversionService._thumbnail(frame, max_dimension)
+                frame = ImageOps.exif_transpose(frame)
+            else:
+                frame = frame.copy()
+                if max_dimension:
+                    frame = ConversionService._thumbnail(frame, max_dimension)
+            durations.append(frame.info.get('duration', img.info.get('duration', 100)))
+            frames.append(ConversionService._image_for(frame, target))
+        
+        params: Dict[str, Any] = {}
+        if img.info.get('icc_profile') and encoder != 'GIF':
+            params['icc_profile'] = img.info['icc_profile']
+        if encoder == 'JPEG':
+            params.update(quality=quality or settings.IMAGE_JPEG_QUALITY, optimize=effort >= 5,
+                          progressive=effort >= 7)
+        elif encoder == 'WEBP':
+            params.update(quality=quality or settings.IMAGE_WEBP_QUALITY, method=round(effort * 6 / 9))
+        elif encoder == 'PNG':
+            params.update(compress_level=effort, optimize=effort >= 9)
+        elif encoder == 'TIFF':
+            params.update(compression='tiff_adobe_deflate')
+        elif encoder == 'GIF':
+            params.update(optimize=effort >= 5)
+        if animated:
+            params.update(save_all=True, append_images=frames[1:], loop=img.info.get('loop', 0),
+                          duration=durations)
+        
         output = BytesIO()
-        audio.export(output, format="mp3", bitrate="192k")
+        frames[0].save(output, format=encoder, **params)
         return output.getvalue()
     
     @staticmethod
-    def convert_file(file_content: bytes, source_format: str, target_format: str) -> bytes:
+    def audio_to_mp3(audio_bytes: bytes, input_format: str) -> bytes:
+        output = ConversionService.transcode_audio(BytesIO(audio_bytes), input_format, 'mp3')
+        try:
+            return output.read()
+        finally:
+            output.close()
+    
+    @staticmethod
+    def transcode_audio(source: BinaryIO, source_format: str, target_format: str,
+                        bitrate: Optional[str] = None, sample_rate: Optional[int] = None,
+                        channels: Optional[int] = None, timeout: Optional[float] = None) -> BinaryIO:
+        """Transcode audio through an ffmpeg subprocess; returns the output as a rewound spooled file.
+
+        Input bytes are fed to ffmpeg's stdin and its stdout is copied out block by block, so
+        nothing is decoded in this process and memory does not grow with duration. ffmpeg is
+        killed once ``timeout`` seconds have passed.
+        """
+        target = target_format.lower()
+        if target not in ConversionService.AUDIO_ENCODERS:
+            raise ValueError(f"Unsupported audio format: {target_format}")
+        ffmpeg = shutil.which(settings.FFMPEG_BINARY)
+        if ffmpeg is None:
+            raise ValueError("Audio conversion is unavailable: install ffmpeg")
+        timeout = timeout or settings.AUDIO_TRANSCODE_TIMEOUT
+        
+        input_file = None
+        if source_format.lower() in ConversionService.SEEKABLE_AUDIO_INPUTS:
+            input_file = tempfile.NamedTemporaryFile(suffix=f".{source_format.lower()}")
+            shutil.copyfileobj(source, input_file, COPY_BYTES)
+            input_file.flush()
+            cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', input_file.name]
+        else:
+            cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0']
+        cmd += ['-vn']
+        if sample_rate:
+            cmd += ['-ar', str(sample_rate)]
+        if channels:
+            cmd += ['-ac', str(channels)]
+        cmd += ConversionService.AUDIO_ENCODERS[target]
+        if target not in ConversionService.LOSSLESS_AUDIO:
+            cmd += ['-b:a', bitrate or settings.AUDIO_BITRATE]
+        cmd += ['pipe:1']
+        
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL if input_file else subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        timed_out = threading.Event()
+        
+        def expire():
+            timed_out.set()
+            proc.kill()
+        
+        def feed():
+            # A separate thread, so a full stdout pipe can never block the writer
+            try:
+                shutil.copyfileobj(source, proc.stdin, COPY_BYTES)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg exited early; its exit code explains why
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        
+        errors = bytearray()
+        
+        def drain_stderr():
+            for line in proc.stderr:
+                errors.extend(line)
+                del errors[:-4096]
+        
+        timer = threading.Timer(timeout, expire)
+        threads = [threading.Thread(target=drain_stderr, daemon=True)]
+        if input_file is None:
+            threads.append(threading.Thread(target=feed, daemon=True))
+        timer.start()
+        for thread in threads:
+            thread.start()
+        try:
+            shutil.copyfileobj(proc.stdout, output, COPY_BYTES)
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            for thread in threads:
+                thread.join()
+            if input_file is not None:
+                input_file.close()
+        
+        if timed_out.is_set():
+            output.close()
+            raise TimeoutError(f"Audio conversion exceeded {timeout:g}s")
+        if proc.returncode != 0:
+            output.close()
+            message = errors.decode('utf-8', errors='replace').strip().splitlines()
+            raise ValueError(f"ffmpeg failed: {message[-1] if message else f'exit code {proc.returncode}'}")
+        output.seek(0)
+        return output
+    
+    @staticmethod
+    def convert_file(file_content: bytes, source_format: str, target_format: str,
+                     sheet: Optional[str] = None, max_dimension: Optional[int] = None,
+                     quality: Optional[int] = None, effort: Optional[int] = None) -> bytes:
         source_lower = source_format.lower()
+        source_lower = ConversionService.FORMAT_ALIASES.get(source_lower, source_lower)
         target_lower = target_format.lower()
         
         # Handle image to PDF conversion for various image formats
         if source_lower in ConversionService.IMAGE_FORMATS and target_lower == 'pdf':
             return img2pdf.convert(file_content)
+        if source_lower in ConversionService.IMAGE_FORMATS and target_lower in ConversionService.IMAGE_ENCODERS:
+            return ConversionService.transcode_image(file_content, target_lower, max_dimension, quality, effort)
         
         conversion_key = f"{source_lower}_to_{target_lower}"
         if conversion_key in ConversionService.SUPPORTED_CONVERSIONS:
-            return ConversionService.SUPPORTED_CONVERSIONS[conversion_key](file_content)
-        if target_lower == "mp3":
-            return ConversionService.audio_to_mp3(file_content, source_lower)
+            return ConversionService.SUPPORTED_CONVERSIONS[conversion_key](file_content, sheet=sheet)
+        if source_lower in ConversionService.AUDIO_FORMATS and target_lower in ConversionService.AUDIO_ENCODERS:
+            output = ConversionService.transcode_audio(BytesIO(file_content), source_lower, target_lower)
+            try:
+                return output.read()
+            finally:
+                output.close()
         raise ValueError(f"Unsupported conversion: {source_format} → {target_format}")
+    
+    @staticmethod
+    def detect_format(content_type: Optional[str], filename: Optional[str]) -> str:
+        """Source format of an upload from its content type, or its extension when that is vague."""
+        name = (filename or "").lower()
+        for fmt in CSV_CODECS:
+            if name.endswith(f".{fmt}"):
+                return fmt
+        subtype = content_type.split('/')[-1].lower() if content_type else ""
+        if not subtype or subtype in ConversionService.GENERIC_SUBTYPES:
+            return name.rsplit('.', 1)[-1]
+        return ConversionService.FORMAT_ALIASES.get(subtype, subtype)
+    
+    @staticmethod
+    def streaming_key(source_format: str, target_format: str) -> Optional[str]:
+        """Conversion key when the pair converts batch by batch, or None when it runs in memory."""
+        source_lower = source_format.lower()
+        source_lower = ConversionService.FORMAT_ALIASES.get(source_lower, source_lower)
+        target_lower = target_format.lower()
+        target_lower = ConversionService.FORMAT_ALIASES.get(target_lower, target_lower)
+        if source_lower in ConversionService.AUDIO_FORMATS and target_lower in ConversionService.AUDIO_ENCODERS:
+            return f"{source_lower}_to_{target_lower}"
+        if (source_lower != target_lower and source_lower in ConversionService.TABULAR_FORMATS
+                and target_lower in ConversionService.TABULAR_FORMATS):
+            return f"{source_lower}_to_{target_lower}"
+        return None
+    
+    @staticmethod
+    def convert_to_file(source: BinaryIO, source_format: str, target_format: str,
+                        sheet: Optional[str] = None, max_dimension: Optional[int] = None,
+                        quality: Optional[int] = None, effort: Optional[int] = None,
+                        bitrate: Optional[str] = None, sample_rate: Optional[int] = None,
+                        channels: Optional[int] = None) -> BinaryIO:
+        """Run any conversion from a file object, streamed when the pair allows it.
+
+        Returns a rewound spooled temp file; the caller closes it.
+        """
+        if ConversionService.streaming_key(source_format, target_format) is not None:
+            return ConversionService.convert_stream(source, source_format, target_format, sheet,
+                                                    bitrate, sample_rate, channels)
+        converted = ConversionService.convert_file(source.read(), source_format, target_format, sheet,
+                                                   max_dimension, quality, effort)
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+        output.write(converted)
+        output.seek(0)
+        return output
+    
+    @staticmethod
+    def add_to_archive(archive: zipfile.ZipFile, name: str, source: BinaryIO):
+        """Copy a file into an open ZIP in blocks, as entry ``name``.
+
+        Formats that are already compressed are stored rather than deflated again.
+        """
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        stored = any(name.lower().endswith(f".{fmt}") for fmt in ConversionService.COMPRESSED_FORMATS)
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        source.seek(0)
+        with archive.open(info, 'w', force_zip64=True) as entry:
+            shutil.copyfileobj(source, entry, COPY_BYTES)
+    
+    @staticmethod
+    def convert_stream(source: BinaryIO, source_format: str, target_format: str,
+                       sheet: Optional[str] = None, bitrate: Optional[str] = None,
+                       sample_rate: Optional[int] = None, channels: Optional[int] = None) -> BinaryIO:
+        """Convert from a file object to a rewound temp file, without holding either in memory."""
+        key = ConversionService.streaming_key(source_format, target_format)
+        if key is None:
+            raise ValueError(f"Unsupported conversion: {source_format} → {target_format}")
+        source_fmt, target_fmt = key.split("_to_")
+        if target_fmt in ConversionService.AUDIO_ENCODERS:
+            return ConversionService.transcode_audio(source, source_fmt, target_fmt, bitrate,
+                                                     sample_rate, channels)
+        if pa is None and ({source_fmt, target_fmt} - {'csv', 'xlsx'}):
+            raise ValueError("Parquet, Arrow and compressed CSV conversions require pyarrow")
+        if target_fmt == 'xlsx':
+            return ConversionService._write_excel(ConversionService.read_chunks(source, source_fmt, sheet))
+        
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+        if source_fmt in ('csv', *CSV_CODECS) and target_fmt in ('csv', *CSV_CODECS):
+            # Only the compression changes; the CSV text is copied without parsing
+            with ConversionService._csv_input(source, source_fmt) as src, \
+                    ConversionService._csv_output(output, target_fmt) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        elif target_fmt in ('csv', *CSV_CODECS):
+            with ConversionService._csv_output(output, target_fmt) as dst:
+                for i, chunk in enumerate(ConversionService.read_chunks(source, source_fmt, sheet)):
+                    if source_fmt == 'xlsx':
+                        chunk = ConversionService._whole_numbers(chunk)
+                    dst.write(chunk.to_csv(index=False, header=i == 0).encode("utf-8"))
+        else:
+            ConversionService._write_columnar(
+                lambda text_columns=None: ConversionService.read_chunks(source, source_fmt, sheet, text_columns),
+                output, target_fmt
+            )
+        output.seek(0)
+        return output
+    
+    @staticmethod
+    def _csv_input(source: BinaryIO, fmt: str):
+        if fmt in CSV_CODECS:
+            return pa.input_stream(_KeepOpen(source), compression=CSV_CODECS[fmt])
+        return _KeepOpen(source)
+    
+    @staticmethod
+    def _csv_output(output: BinaryIO, fmt: str):
+        if fmt in CSV_CODECS:
+            return pa.output_stream(_KeepOpen(output), compression=CSV_CODECS[fmt])
+        return _KeepOpen(output)
+    
+    @staticmethod
+    def read_chunks(source: BinaryIO, fmt: str, sheet: Optional[str] = None,
+                    text_columns: Optional[Iterable[str]] = None) -> Iterator[pd.DataFrame]:
+        """Read a tabular source as DataFrame chunks of about CONVERSION_CHUNK_ROWS rows.
+
+        ``text_columns`` are returned as strings; CSV keeps their original text.
+        """
+        chunk_rows = settings.CONVERSION_CHUNK_ROWS
+        text_columns = list(text_columns or [])
+        source.seek(0)
+        if fmt in ('csv', *CSV_CODECS):
+            stream = ConversionService._csv_input(source, fmt)
+            chunks = pd.read_csv(stream, chunksize=chunk_rows, float_precision="round_trip",
+                                 dtype={c: str for c in text_columns})
+        elif fmt == 'xlsx':
+            chunks = loader_service.iter_excel(source, sheet, chunk_rows)
+        elif fmt == 'parquet':
+            chunks = (batch.to_pandas() for batch in pq.ParquetFile(source).iter_batches(chunk_rows))
+        elif fmt in ('feather', 'arrow'):
+            reader = pa.ipc.open_file(source)
+            chunks = (reader.get_batch(i).to_pandas() for i in range(reader.num_record_batches))
+        else:
+            raise ValueError(f"Unsupported source format: {fmt}")
+        for chunk in chunks:
+            for col in text_columns:
+                if chunk[col].dtype != object and not pd.api.types.is_string_dtype(chunk[col].dtype):
+                    chunk[col] = as_text(chunk[col])
+            yield chunk
+    
+    @staticmethod
+    def _column_types(chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+        """Widest dtype of every column over all chunks, or None for columns stored as text.
+
+        Ints widen to floats; columns whose chunks disagree in any other way become text.
+        Empty chunks of a column do not vote.
+        """
+        seen: Dict[str, set] = {}
+        for chunk in chunks:
+            for col in chunk.columns:
+                dtypes = seen.setdefault(col, set())
+                if chunk[col].notna().any():
+                    dtypes.add(chunk[col].dtype)
+        types = {}
+        for col, dtypes in seen.items():
+            kinds = {d.kind for d in dtypes}
+            if not dtypes:
+                types[col] = np.dtype(np.float64)
+            elif kinds & {'O', 'U', 'S'}:
+                types[col] = None
+            elif len(dtypes) == 1:
+                types[col] = dtypes.pop()
+            elif kinds <= {'i', 'u', 'f'}:
+                types[col] = np.result_type(*dtypes)
+            else:
+                types[col] = None
+        return types
+    
+    @staticmethod
+    def _write_columnar(chunks: Callable[..., Iterator[pd.DataFrame]], output: BinaryIO, fmt: str):
+        """Write Parquet or Arrow IPC (Feather v2) in row batches with one schema for the whole file.
+
+        The source is read twice: once to settle each column's type across all batches,
+        then again to write, so memory stays at one batch.
+        """
+        types = ConversionService._column_types(chunks())
+        text_columns = [col for col, dtype in types.items() if dtype is None]
+        fields = []
+        for col, dtype in types.items():
+            if dtype is None:
+                fields.append(pa.field(str(col), pa.string()))
+            else:
+                empty = pd.DataFrame({str(col): pd.Series([], dtype=dtype)})
+                fields.append(pa.Schema.from_pandas(empty, preserve_index=False).field(0))
+        schema = pa.schema(fields)
+        
+        if fmt == 'parquet':
+            writer = pq.ParquetWriter(_KeepOpen(output), schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(_KeepOpen(output), schema,
+                                     options=pa.ipc.IpcWriteOptions(compression="lz4"))
+        try:
+            for chunk in chunks(text_columns):
+                chunk.columns = schema.names
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        finally:
+            writer.close()
 
 conversion_service = ConversionService()
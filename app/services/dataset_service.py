@@ -0,0 +1,232 @@
+import pandas as pd
+import numpy as np
+import json
+import logging
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.services.minio_service import minio_service
+from app.services.profiling_service import as_text
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+_AGGREGATES = {"count", "sum", "mean", "min", "max", "median", "std", "nunique", "quantile"}
+
+class ParquetSink:
+    """Write DataFrame chunks to one Parquet file with a fixed schema.
+
+    The schema is taken from the first chunk as read: integer, float, boolean and naive
+    datetime columns keep their type and every other column is stored as text, so later
+    chunks cannot drift to another type. A later chunk that does not fit (say decimals in a
+    column that started as whole numbers) makes the sink give up, and ``close`` returns None.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.rows = 0
+        self.failed = False
+        self._schema: Optional["pa.Schema"] = None
+        self._writer: Optional["pq.ParquetWriter"] = None
+
+    @staticmethod
+    def _field_type(dtype) -> "pa.DataType":
+        if pd.api.types.is_bool_dtype(dtype):
+            return pa.bool_()
+        if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+            return pa.int64()
+        if pd.api.types.is_float_dtype(dtype):
+            return pa.float64()
+        if pd.api.types.is_datetime64_dtype(dtype):
+            return pa.from_numpy_dtype(dtype)
+        return pa.string()
+
+    def write(self, chunk: pd.DataFrame):
+        if self.failed:
+            return
+        if self._writer is None:
+            self._schema = pa.schema([
+                (str(col), ParquetSink._field_type(chunk[col].dtype)) for col in chunk.columns
+            ])
+            self._writer = pq.ParquetWriter(self.file, self._schema, compression="zstd")
+        chunk = chunk.copy()
+        chunk.columns = self._schema.names
+        for field in self._schema:
+            if field.type == pa.string():
+                chunk[field.name] = as_text(chunk[field.name])
+        try:
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning("Rows do not fit the dataset schema, not saving the dataset: %s", e)
+            self.failed = True
+            return
+        self._writer.write_table(table, row_group_size=settings.ANALYSIS_PARQUET_ROW_GROUP_ROWS)
+        self.rows += len(chunk)
+
+    def close(self) -> Optional[BinaryIO]:
+        """Finish the file and return it rewound, or None when the sink gave up."""
+        if self._writer is not None:
+            self._writer.close()
+        if self.failed:
+            self.file.close()
+            return None
+        self.file.seek(0)
+        return self.file
+
+class DatasetService:
+    @staticmethod
+    def write_frame(df: pd.DataFrame) -> BinaryIO:
+        """Serialize an in-memory frame to a Parquet temp file, keeping its compact dtypes."""
+        df = df.rename(columns=str)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type object columns (common in Excel) are stored as text
+            df = df.copy()
+            for col in df.columns[df.dtypes == object]:
+                df[col] = as_text(df[col])
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        out = tempfile.TemporaryFile()
+        pq.write_table(table, out, row_group_size=settings.ANALYSIS_PARQUET_ROW_GROUP_ROWS,
+                       compression="zstd")
+        out.seek(0)
+        return out
+
+    @staticmethod
+    def upload(parquet_file: BinaryIO, user_id: Optional[int] = None) -> str:
+        """Stream a finished Parquet file to MinIO and return its object name."""
+        parquet_file.seek(0, 2)
+        length = parquet_file.tell()
+        parquet_file.seek(0)
+        try:
+            return minio_service.upload_stream(
+                filename="dataset.parquet",
+                stream=parquet_file,
+                length=length,
+                metadata={'type': 'analysis_dataset', 'user_id': str(user_id)}
+            )
+        finally:
+            parquet_file.close()
+
+    @staticmethod
+    def iter_chunks(dataset_objects: List[str], batch_rows: Optional[int] = None,
+                    filesystem=None) -> Iterator[pd.DataFrame]:
+        """Read stored Parquet parts back as DataFrame batches, one batch in memory at a time."""
+        if pa is None:
+            raise RuntimeError("Reading stored datasets requires pyarrow")
+        filesystem = filesystem or minio_service.arrow_filesystem()
+        for object_name in dataset_objects:
+            dataset = ds.dataset(f"{minio_service.bucket}/{object_name}", format="parquet",
+                                 filesystem=filesystem)
+            for batch in dataset.to_batches(batch_size=batch_rows or settings.ANALYSIS_CHUNK_ROWS):
+                yield batch.to_pandas()
+
+    @staticmethod
+    def _filter_expression(filters: List[Dict[str, Any]]):
+        expression = None
+        for f in filters:
+            field, op, value = ds.field(f["column"]), f["op"], f.get("value")
+            if op == "==":
+                term = field == value
+            elif op == "!=":
+                term = field != value
+            elif op == "<":
+                term = field < value
+            elif op == "<=":
+                term = field <= value
+            elif op == ">":
+                term = field > value
+            elif op == ">=":
+                term = field >= value
+            elif op == "in":
+                term = field.isin(value)
+            elif op == "not_in":
+                term = ~field.isin(value)
+            elif op == "is_null":
+                term = field.is_null()
+            elif op == "not_null":
+                term = field.is_valid()
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            expression = term if expression is None else expression & term
+        return expression
+
+    @staticmethod
+    def query(dataset_objects: List[str], filters: List[Dict[str, Any]], group_by: List[str],
+              aggregates: List[Dict[str, Any]], columns: List[str], limit: int,
+              filesystem=None) -> Dict[str, Any]:
+        """Filter / group-by / aggregate over stored Parquet parts.
+
+        Only the referenced columns are read, and row groups whose min/max statistics
+        cannot match the filters are skipped before any data is fetched.
+        """
+        if pa is None:
+            raise RuntimeError("Dataset queries require pyarrow")
+        filesystem = filesystem or minio_service.arrow_filesystem()
+        expression = DatasetService._filter_expression(filters)
+        for agg in aggregates:
+            if agg["func"] not in _AGGREGATES:
+                raise ValueError(f"Unsupported aggregate: {agg['func']}")
+
+        frames, scanned, total_groups, read_groups = [], None, 0, 0
+        for object_name in dataset_objects:
+            dataset = ds.dataset(f"{minio_service.bucket}/{object_name}", format="parquet",
+                                 filesystem=filesystem)
+            names = dataset.schema.names
+            referenced = set(group_by) | {a["column"] for a in aggregates} | set(columns)
+            referenced |= {f["column"] for f in filters}
+            unknown = referenced - set(names)
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+            if aggregates or group_by:
+                needed = list(dict.fromkeys(group_by + [a["column"] for a in aggregates]))
+            else:
+                needed = columns or names
+            scanned = needed
+            try:
+                # Row-group pruning happens here, from the footer's min/max statistics
+                for fragment in dataset.get_fragments():
+                    total_groups += fragment.num_row_groups
+                    read_groups += (len(fragment.split_by_row_group(expression))
+                                    if expression is not None else fragment.num_row_groups)
+                table = dataset.to_table(columns=needed, filter=expression)
+            except (pa.ArrowNotImplementedError, pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(f"Invalid filter: {e}")
+            frames.append(table.to_pandas())
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+        if aggregates:
+            named = {}
+            for agg in aggregates:
+                alias = agg.get("alias") or f"{agg['column']}_{agg['func']}"
+                if agg["func"] == "quantile":
+                    q = agg.get("q", 0.5)
+                    named[alias] = (agg["column"], lambda s, q=q: s.quantile(q))
+                else:
+                    named[alias] = (agg["column"], agg["func"])
+            if group_by:
+                out = df.groupby(group_by, dropna=False, observed=True).agg(**named).reset_index()
+            else:
+                out = pd.DataFrame({
+                    alias: [df[col].agg(func)] for alias, (col, func) in named.items()
+                })
+        elif group_by:
+            out = df.groupby(group_by, dropna=False, observed=True).size().reset_index(name="count")
+        else:
+            out = df
+
+        return {
+            "columns": [str(c) for c in out.columns],
+            "rows": json.loads(out.head(limit).to_json(orient="records", date_format="iso", double_precision=15)),
+            "row_count": len(out),
+            "scanned_columns": scanned,
+            "row_groups": {"total": total_groups, "read": read_groups},
+        }
+
+dataset_service = DatasetService()
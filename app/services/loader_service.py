@@ -0,0 +1,193 @@
+import pandas as pd
+import numpy as np
+from io import BytesIO
+from typing import Any, Iterator, List, Optional, Union
+from openpyxl import load_workbook
+from app.core.config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except Exception:
+    pa = None
+
+# Column selector for text-like columns, whatever dtype the loader gave them
+TEXT_DTYPES = ['object', 'string', 'category']
+
+# Deep size of a Python str is about 49 bytes of header plus one byte per ASCII char
+_PY_STR_OVERHEAD = 49
+
+class LoaderService:
+    @staticmethod
+    def _baseline_bytes(s: pd.Series) -> int:
+        """Memory the column would take with 64-bit numbers and Python-object strings."""
+        if pa is not None and isinstance(s.dtype, pd.ArrowDtype):
+            t = s.dtype.pyarrow_dtype
+            if pa.types.is_string(t) or pa.types.is_large_string(t):
+                present = int(s.notna().sum())
+                return 8 * len(s) + _PY_STR_OVERHEAD * present + int(s.str.len().sum())
+            return 8 * len(s)
+        return int(s.memory_usage(deep=True, index=False))
+
+    @staticmethod
+    def _compact_series(s: pd.Series, downcast_floats: bool, categorize: bool = True) -> pd.Series:
+        """Smallest lossless representation of one column."""
+        if pa is not None and isinstance(s.dtype, pd.ArrowDtype):
+            t = s.dtype.pyarrow_dtype
+            if pa.types.is_integer(t) and not s.hasnans:
+                s = pd.Series(s.to_numpy(dtype=t.to_pandas_dtype()), index=s.index, name=s.name)
+            elif pa.types.is_integer(t) or pa.types.is_floating(t):
+                s = pd.Series(s.to_numpy(dtype=np.float64, na_value=np.nan), index=s.index, name=s.name)
+            elif not (pa.types.is_string(t) or pa.types.is_large_string(t)):
+                # Dates, times, booleans: the same types the default backend produces
+                s = pd.Series(pa.array(s.array).to_pandas(), index=s.index, name=s.name)
+
+        if pd.api.types.is_integer_dtype(s.dtype) and not isinstance(s.dtype, pd.CategoricalDtype):
+            return pd.to_numeric(s, downcast="integer")
+        if pd.api.types.is_float_dtype(s.dtype):
+            if downcast_floats and s.dtype == np.float64:
+                narrow = s.astype(np.float32)
+                # Only keep float32 when every value survives the round trip exactly
+                if np.array_equal(narrow.to_numpy(np.float64), s.to_numpy(), equal_nan=True):
+                    return narrow
+            return s
+        if s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) != "string":
+            return s  # mixed values (common in Excel) stay as they are
+        if pd.api.types.is_string_dtype(s.dtype):
+            present = int(s.notna().sum())
+            if categorize and present and s.nunique() <= present * settings.LOADER_CATEGORY_RATIO:
+                return s.astype("category")
+            if pa is not None:
+                return s.astype(pd.StringDtype("pyarrow"))
+        return s
+
+    @staticmethod
+    def compact(df: pd.DataFrame, downcast_floats: bool = True, categorize: bool = True) -> pd.DataFrame:
+        """Replace columns one at a time with compact dtypes, recording before/after memory.
+
+        Sizes are kept in ``df.attrs`` (``memory_before_bytes``/``memory_after_bytes``).
+        """
+        before = after = 0
+        for col in df.columns:
+            s = df[col]
+            before += LoaderService._baseline_bytes(s)
+            s = LoaderService._compact_series(s, downcast_floats, categorize)
+            after += int(s.memory_usage(deep=True, index=False))
+            df[col] = s
+        df.attrs["memory_before_bytes"] = before
+        df.attrs["memory_after_bytes"] = after
+        return df
+
+    @staticmethod
+    def read_csv(source: Union[bytes, Any], downcast_floats: bool = True) -> pd.DataFrame:
+        """Parse CSV straight into Arrow buffers, then compact column by column.
+
+        Text never exists as Python objects, so peak memory is the Arrow table plus one column.
+        Dates and times stay as their original text, as the C parser (and stream mode) reads them.
+        """
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        if pa is not None:
+            start = source.tell()
+            try:
+                df = pd.read_csv(source, engine="pyarrow", dtype_backend="pyarrow")
+                temporal = [col for col in df.columns if isinstance(df[col].dtype, pd.ArrowDtype)
+                            and pa.types.is_temporal(df[col].dtype.pyarrow_dtype)]
+                if temporal:
+                    # Arrow infers timestamps; re-read just those columns as text
+                    source.seek(start)
+                    text = pa_csv.read_csv(source, convert_options=pa_csv.ConvertOptions(
+                        include_columns=temporal, column_types={col: pa.string() for col in temporal},
+                        strings_can_be_null=True))
+                    for col in temporal:
+                        df[col] = pd.Series(text.column(col).to_pandas(types_mapper=pd.ArrowDtype),
+                                            index=df.index, name=col)
+                    del text
+                return LoaderService.compact(df, downcast_floats)
+            except (pa.ArrowInvalid, ValueError):
+                source.seek(start)  # fall back to the C parser for inputs Arrow rejects
+        return LoaderService.compact(pd.read_csv(source), downcast_floats)
+
+    @staticmethod
+    def excel_sheets(source: Union[bytes, Any]) -> List[str]:
+        """Worksheet names, read from the workbook index without loading any cells."""
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        start = source.tell()
+        wb = load_workbook(source, read_only=True)
+        try:
+            return wb.sheetnames
+        finally:
+            wb.close()
+            source.seek(start)
+
+    @staticmethod
+    def _excel_value(value: Any) -> Any:
+        # Whole-number floats become ints, as pandas.read_excel does
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    @staticmethod
+    def iter_excel(source: Union[bytes, Any], sheet: Optional[str] = None,
+                   batch_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Stream one worksheet as DataFrame batches using openpyxl's read-only row iterator.
+
+        Only the current batch is held in memory; the first row is the header.
+        """
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        batch_rows = batch_rows or settings.ANALYSIS_CHUNK_ROWS
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            if sheet is not None and sheet not in wb.sheetnames:
+                raise ValueError(f"Worksheet '{sheet}' not found")
+            rows = wb[sheet].iter_rows(values_only=True) if sheet else wb.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            while header and header[-1] is None:
+                header.pop()
+            columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+            width = len(columns)
+            
+            batch, blank, start = [], 0, 0
+            for row in rows:
+                values = [LoaderService._excel_value(v) for v in row[:width]]
+                if all(v is None for v in values):
+                    blank += 1  # kept only if more data follows, like read_excel
+                    continue
+                batch.extend([[None] * width] * blank)
+                blank = 0
+                values.extend([None] * (width - len(values)))
+                batch.append(values)
+                if len(batch) >= batch_rows:
+                    yield pd.DataFrame(batch, columns=columns,
+                                       index=pd.RangeIndex(start, start + len(batch)))
+                    start += len(batch)
+                    batch = []
+            if batch or start == 0:
+                yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+        finally:
+            wb.close()
+
+    @staticmethod
+    def read_excel(source: Union[bytes, Any], downcast_floats: bool = True,
+                   sheet: Optional[str] = None) -> pd.DataFrame:
+        """Load a worksheet batch by batch, compacting each batch before the next is read."""
+        before, batches = 0, []
+        for batch in LoaderService.iter_excel(source, sheet):
+            # Categories are decided once over the whole sheet, after the batches are joined
+            batches.append(LoaderService.compact(batch, downcast_floats, categorize=False))
+            before += batch.attrs["memory_before_bytes"]
+        df = pd.concat(batches) if len(batches) > 1 else batches[0]
+        del batches
+        df = LoaderService.compact(df, downcast_floats)
+        df.attrs["memory_before_bytes"] = before
+        return df
+
+    @staticmethod
+    def read_json(source: Union[bytes, Any], downcast_floats: bool = True) -> pd.DataFrame:
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        return LoaderService.compact(pd.read_json(source), downcast_floats)
+
+loader_service = LoaderService()
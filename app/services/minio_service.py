@@ -2,8 +2,9 @@ from minio import Minio
 from minio.error import S3Error
 import io
 import logging
+import tempfile
 from app.core.config import settings
-from typing import Optional
+from typing import BinaryIO, Optional
 from datetime import timedelta
 import uuid
 import os
@@ -29,6 +30,7 @@ class MinIOService:
             region="us-east-1"  # Must match server region to avoid network lookup
         )
         self.bucket = settings.MINIO_BUCKET
+        self._arrow_fs = None
         self._ensure_bucket()
     
     def _ensure_bucket(self):
@@ -40,8 +42,13 @@ class MinIOService:
                 "MinIO bucket check failed: %s", exc
             )
     
-    def upload_file(self, filename: str, file_content: bytes, metadata: dict = None) -> str:
-        object_name = f"{uuid.uuid4()}/{filename}"
+    def new_object_name(self, filename: str) -> str:
+        return f"{uuid.uuid4()}/{filename}"
+    
+    def upload_file(self, filename: str, file_content: bytes, metadata: dict = None,
+                    object_name: Optional[str] = None) -> str:
+        # object_name lets a caller hand out a URL before the upload happens
+        object_name = object_name or self.new_object_name(filename)
         self.client.put_object(
             self.bucket, object_name, io.BytesIO(file_content),
             length=len(file_content),
@@ -49,6 +56,18 @@ class MinIOService:
         )
         return object_name
     
+    def upload_stream(self, filename: str, stream: BinaryIO, length: int = -1,
+                      metadata: dict = None) -> str:
+        """Upload from a file object; unknown lengths are sent as a multipart upload."""
+        object_name = self.new_object_name(filename)
+        self.client.put_object(
+            self.bucket, object_name, stream,
+            length=length,
+            part_size=10 * 1024 * 1024 if length < 0 else 0,
+            metadata=metadata
+        )
+        return object_name
+    
     def download_file(self, object_name: str) -> Optional[bytes]:
         try:
             response = self.client.get_object(self.bucket, object_name)
@@ -56,6 +75,25 @@ class MinIOService:
         except S3Error:
             return None
     
+    def download_stream(self, object_name: str) -> Optional[BinaryIO]:
+        """Copy an object into a rewound spooled temp file, a block at a time."""
+        try:
+            response = self.client.get_object(self.bucket, object_name)
+        except S3Error:
+            return None
+        output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+        try:
+            for block in response.stream(1024 * 1024):
+                output.write(block)
+        except Exception:
+            output.close()
+            raise
+        finally:
+            response.close()
+            response.release_conn()
+        output.seek(0)
+        return output
+    
     def delete_file(self, object_name: str):
         self.client.remove_object(self.bucket, object_name)
     
@@ -70,6 +108,19 @@ class MinIOService:
             pass
         return None
     
+    def arrow_filesystem(self):
+        """S3 filesystem for pyarrow, so Parquet readers fetch only the byte ranges they need."""
+        if self._arrow_fs is None:
+            from pyarrow import fs
+            self._arrow_fs = fs.S3FileSystem(
+                access_key=settings.MINIO_ACCESS_KEY,
+                secret_key=settings.MINIO_SECRET_KEY,
+                endpoint_override=settings.MINIO_ENDPOINT,
+                scheme="http",
+                region="us-east-1"
+            )
+        return self._arrow_fs
+    
     def get_presigned_url(self, object_name: str, expires: int = 3600) -> str:
         # MinIO expects a timedelta for expires; accept int seconds for convenience.
         exp = timedelta(seconds=expires) if isinstance(expires, int) else expires
@@ -1,32 +1,382 @@
 from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
 from io import BytesIO
 import img2pdf
 try:
     from docx2pdf import convert as docx2pdf
 except Exception:
     docx2pdf = None
-from typing import List
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import accumulate, islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 try:
     import fitz  # PyMuPDF for better conversion
 except Exception:
     fitz = None
 import os
+import tempfile
+from app.core.config import settings
+
+class _Advances(dict):
+    """Glyph advance per character at one font size, measured on first use."""
+
+    def __init__(self, font: "fitz.Font", font_size: float):
+        super().__init__()
+        self.font = font
+        self.font_size = font_size
+
+    def __missing__(self, char: str) -> float:
+        width = self[char] = self.font.text_length(char, fontsize=self.font_size)
+        return width
+
+class _GlyphIds(dict):
+    """Hex glyph id per character, for text shown in a font with Identity-H encoding."""
+
+    def __init__(self, font: "fitz.Font"):
+        super().__init__()
+        self.font = font
+
+    def __missing__(self, char: str) -> str:
+        gid = self[char] = "%04x" % self.font.has_glyph(ord(char))
+        return gid
 
 class PDFService:
+    # Named page sizes for image PDFs; "auto" sizes each page to its image
+    PAGE_SIZES = {'auto', *img2pdf.papersizes}
+    FIT_MODES = set(img2pdf.FitMode.__members__)
+    
     @staticmethod
     def merge_pdfs(pdf_files: List[bytes]) -> bytes:
         """Merge multiple PDF files into one."""
-        merger = PdfWriter()
+        output, _ = PDFService.merge_files(BytesIO(content) for content in pdf_files)
+        with output:
+            return output.read()
+    
+    @staticmethod
+    def merge_files(sources: Iterable[BinaryIO]) -> Tuple[BinaryIO, int]:
+        """Merge PDFs read one at a time from ``sources`` into a temp file on disk.
+
+        Pages are appended with incremental saves every ``PDF_MERGE_FLUSH_BYTES`` of input,
+        after which the output is reopened lazily, so memory holds one input plus the pages
+        not yet flushed. Returns the rewound output and its page count.
+        """
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        try:
+            if fitz is None:
+                # Without PyMuPDF, pypdf keeps every page in memory until the end
+                writer = PdfWriter()
+                for source in sources:
+                    for page in PdfReader(source).pages:
+                        writer.add_page(page)
+                with open(path, "wb") as f:
+                    writer.write(f)
+                pages = len(writer.pages)
+            else:
+                pages = PDFService._merge_incremental(sources, path)
+            # MuPDF may replace the file on save, so it is opened only once finished
+            return open(path, "rb"), pages
+        finally:
+            os.unlink(path)  # the open handle keeps the data until it is closed
+    
+    @staticmethod
+    def _merge_incremental(sources: Iterable[BinaryIO], path: str) -> int:
+        doc, pending, saved = fitz.open(), 0, False
+        try:
+            for number, source in enumerate(sources, 1):
+                data = source.read()
+                try:
+                    src = fitz.open("pdf", data)
+                except RuntimeError as e:  # FileDataError and other MuPDF parse errors
+                    raise ValueError(f"Input {number} is not a valid PDF: {e}")
+                try:
+                    if src.needs_pass:
+                        raise ValueError(f"Input {number} is encrypted")
+                    doc.insert_pdf(src)
+                finally:
+                    src.close()
+                pending += len(data)
+                del data
+                if pending >= settings.PDF_MERGE_FLUSH_BYTES:
+                    if saved:
+                        doc.saveIncr()
+                    else:
+                        doc.save(path)
+                        saved = True
+                    doc.close()
+                    doc, pending = fitz.open(path), 0
+            if doc.page_count == 0:
+                raise ValueError("No pages to merge")
+            if not saved:
+                doc.save(path, garbage=1)
+            elif pending:
+                doc.saveIncr()
+            return doc.page_count
+        finally:
+            doc.close()
+    
+    @staticmethod
+    def _reader(source: BinaryIO) -> PdfReader:
+        try:
+            reader = PdfReader(source)
+            if reader.is_encrypted and not reader.decrypt(""):
+                raise ValueError("PDF is encrypted")
+            return reader
+        except PdfReadError as e:
+            raise ValueError(f"Invalid PDF: {e}")
+    
+    @staticmethod
+    def parse_pages(spec: str, page_count: int) -> List[int]:
+        """0-based page indices for a 1-based spec such as "1-3,5,8-" (open ends run to the edge)."""
+        indices = []
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            start, sep, end = part.partition("-")
+            try:
+                first = int(start) if start.strip() else 1
+                last = (int(end) if end.strip() else page_count) if sep else first
+            except ValueError:
+                raise ValueError(f"Invalid page range '{part}'")
+            if not 1 <= first <= last <= page_count:
+                raise ValueError(f"Page range '{part}' is outside 1-{page_count}")
+            indices.extend(range(first - 1, last))
+        if not indices:
+            raise ValueError("No pages selected")
+        return indices
+    
+    @staticmethod
+    def page_plan(operation: str, page_count: int, pages: Optional[str] = None,
+                  ranges: Optional[List[str]] = None, every: Optional[int] = None,
+                  order: Optional[List[int]] = None,
+                  angle: int = 90) -> Tuple[List[List[int]], Dict[int, int]]:
+        """Output documents (source page indices each) and rotations for a page operation."""
+        everything = list(range(page_count))
+        rotations = {}
+        if operation == "split":
+            if ranges:
+                groups = [PDFService.parse_pages(spec, page_count) for spec in ranges]
+            elif every:
+                groups = [everything[i:i + every] for i in range(0, page_count, every)]
+            else:
+                raise ValueError("split needs ranges or every")
+        elif operation == "extract":
+            if not pages:
+                raise ValueError("extract needs pages")
+            groups = [PDFService.parse_pages(pages, page_count)]
+        elif operation == "delete":
+            if not pages:
+                raise ValueError("delete needs pages")
+            deleted = set(PDFService.parse_pages(pages, page_count))
+            groups = [[i for i in everything if i not in deleted]]
+            if not groups[0]:
+                raise ValueError("Cannot delete every page")
+        elif operation == "reorder":
+            groups = [[number - 1 for number in order or []]]
+            if sorted(groups[0]) != everything:
+                raise ValueError(f"order must list pages 1-{page_count}, each once")
+        elif operation == "rotate":
+            groups = [everything]
+            selected = PDFService.parse_pages(pages, page_count) if pages else everything
+            rotations = {i: angle % 360 for i in selected}
+        else:
+            raise ValueError(f"Unknown page operation: {operation}")
+        for group in groups:
+            if len(set(group)) != len(group):
+                raise ValueError("A page can appear only once per document")
+        return groups, rotations
+    
+    @staticmethod
+    def write_pages(source: Union[BinaryIO, PdfReader], groups: List[List[int]],
+                    rotations: Optional[Dict[int, int]] = None) -> List[Tuple[BinaryIO, int]]:
+        """Copy pages of one PDF into new documents, in a single pass over the source.
+
+        pypdf parses a page (and the objects it references) only when it is accessed, so
+        unreferenced pages are never read. Each source page is parsed once and handed to every
+        document that uses it; a document is written out as soon as its last page is placed.
+        Returns a rewound spooled file and page count per document.
+        """
+        rotations = rotations or {}
+        reader = source if isinstance(source, PdfReader) else PDFService._reader(source)
+        
+        # Where each source page goes: (document, position within it)
+        targets = defaultdict(list)
+        for doc, group in enumerate(groups):
+            for position, index in enumerate(group):
+                targets[index].append((doc, position))
+        finished_at = defaultdict(list)
+        for doc, group in enumerate(groups):
+            finished_at[max(group)].append(doc)
         
-        for pdf_content in pdf_files:
-            reader = PdfReader(BytesIO(pdf_content))
-            for page in reader.pages:
-                merger.add_page(page)
+        writers = [PdfWriter() for _ in groups]
+        placed = [[] for _ in groups]
+        outputs = [None] * len(groups)
+        try:
+            for index in sorted(targets):
+                page = reader.pages[index]
+                for doc, position in targets[index]:
+                    # Pages arrive in source order; slot each one at its position in the document
+                    at = bisect_left(placed[doc], position)
+                    placed[doc].insert(at, position)
+                    added = writers[doc].insert_page(page, at)
+                    if rotations.get(index):
+                        added.rotate(rotations[index])
+                for doc in finished_at.pop(index, ()):
+                    output = tempfile.SpooledTemporaryFile(max_size=settings.CONVERSION_SPOOL_BYTES)
+                    outputs[doc] = (output, len(groups[doc]))
+                    writers[doc].write(output)
+                    output.seek(0)
+                    writers[doc] = None
+        except Exception as e:
+            for output in outputs:
+                if output is not None:
+                    output[0].close()
+            if isinstance(e, PdfReadError):
+                raise ValueError(f"Invalid PDF: {e}")
+            raise
+        return outputs
+    
+    @staticmethod
+    def page_operation(source: BinaryIO, operation: str, pages: Optional[str] = None,
+                       ranges: Optional[List[str]] = None, every: Optional[int] = None,
+                       order: Optional[List[int]] = None, angle: int = 90) -> List[Tuple[BinaryIO, int]]:
+        """Plan and run a page operation; only the page tree is read before pages are copied."""
+        reader = PDFService._reader(source)
+        groups, rotations = PDFService.page_plan(operation, len(reader.pages), pages, ranges,
+                                                 every, order, angle)
+        if len(groups) > settings.PDF_SPLIT_MAX_DOCUMENTS:
+            raise ValueError(f"At most {settings.PDF_SPLIT_MAX_DOCUMENTS} documents per split")
+        return PDFService.write_pages(reader, groups, rotations)
+    
+    @staticmethod
+    def images_to_pdf(images: List[Union[bytes, BinaryIO]], output: BinaryIO, page_size: str = "auto",
+                      fit: str = "into", margin_mm: float = 0, auto_orient: bool = False) -> int:
+        """Write one PDF page per image frame to ``output`` with img2pdf; returns the page count.
+
+        JPEG and JPEG 2000 data is embedded as-is, and most PNG/TIFF data is copied without
+        decoding, so pages are never re-encoded. Multi-frame TIFF/GIF inputs give several pages.
+        """
+        if page_size not in PDFService.PAGE_SIZES:
+            raise ValueError(f"Unknown page size: {page_size}")
+        if fit not in PDFService.FIT_MODES:
+            raise ValueError(f"Unknown fit mode: {fit}")
+        kwargs = {}
+        if page_size != "auto" or margin_mm:
+            pagesize = img2pdf.parse_pagesize_rectarg(img2pdf.papersizes[page_size]) if page_size != "auto" else None
+            border = (img2pdf.mm_to_pt(margin_mm),) * 2 if margin_mm else None
+            kwargs["layout_fun"] = img2pdf.get_layout_fun(pagesize, None, border, img2pdf.FitMode[fit], auto_orient)
+        start = output.tell()
+        img2pdf.convert(*images, outputstream=output, **kwargs)
+        end = output.tell()
+        output.seek(start)
+        try:
+            return len(PdfReader(output).pages)  # reads only the xref and page tree
+        finally:
+            output.seek(end)
+    
+    @staticmethod
+    def _text_font(text: str) -> Tuple[str, "fitz.Font", Union[bytes, None]]:
+        """(font name, font, buffer to embed or None) able to show every character of ``text``."""
+        if settings.PDF_TEXT_FONT_FILE:
+            font = fitz.Font(fontfile=settings.PDF_TEXT_FONT_FILE)
+            return "F0", font, font.buffer
+        try:
+            text.encode("latin-1")
+            return "helv", fitz.Font("helv"), None  # base-14 font, nothing to embed
+        except UnicodeEncodeError:
+            # MuPDF's built-in Droid Sans Fallback covers Latin, Greek, Cyrillic and CJK
+            font = fitz.Font("cjk")
+            return "F0", font, font.buffer
+    
+    @staticmethod
+    def _wrap(line: str, advances: _Advances, width: float) -> Iterator[str]:
+        """Greedy word wrap; words wider than the line are broken between characters."""
+        if not line:
+            yield line
+            return
+        widths = list(map(advances.__getitem__, line))
+        if sum(widths) <= width:
+            yield line
+            return
+        ends = list(accumulate(widths))
+        start, offset, n = 0, 0.0, len(line)
+        while start < n:
+            end = bisect_right(ends, offset + width)  # line[start:end] fits
+            if end >= n:
+                yield line[start:]
+                return
+            space = line.rfind(" ", start, end + 1)
+            if space > start:
+                yield line[start:space]
+                start = space + 1
+            else:
+                end = max(end, start + 1)
+                yield line[start:end]
+                start = end
+            offset = ends[start - 1]
+    
+    @staticmethod
+    def text_to_pdf(text: Union[str, bytes], font_size: float = None, page_size: str = None,
+                    margin: float = None) -> bytes:
+        """Typeset plain text with word wrap and pagination.
+
+        Lines are wrapped from the font's glyph widths, and each page gets one content stream
+        holding all of its lines; every page shares a single font resource. Non-Latin-1 text
+        embeds a Unicode font, subset to the glyphs used.
+        """
+        if fitz is None:
+            raise ValueError("Text-to-PDF conversion is unavailable: install PyMuPDF")
+        if isinstance(text, bytes):
+            text = text.decode("utf-8-sig", errors="replace")
+        text = text.expandtabs(4)
+        font_size = font_size or settings.PDF_TEXT_FONT_SIZE
+        margin = settings.PDF_TEXT_MARGIN if margin is None else margin
+        rect = fitz.paper_rect(page_size or settings.PDF_TEXT_PAGE_SIZE)
+        fontname, font, buffer = PDFService._text_font(text)
+        if buffer is None:
+            encode = lambda line: line.encode("latin-1").hex()
+        else:
+            glyphs = _GlyphIds(font)
+            encode = lambda line: "".join(map(glyphs.__getitem__, line))
         
-        output = BytesIO()
-        merger.write(output)
-        output.seek(0)
-        return output.read()
+        leading = font_size * settings.PDF_TEXT_LINE_HEIGHT
+        per_page = max(1, int((rect.height - 2 * margin) // leading))
+        # Text space starts at the bottom left; the first baseline sits one ascent below the margin
+        head = (f"BT /{fontname} {font_size:g} Tf {leading:g} TL "
+                f"1 0 0 1 {margin:g} {rect.height - margin - font_size * font.ascender:g} Tm\n")
+        advances = _Advances(font, font_size)
+        lines = (part for line in text.splitlines()
+                 for part in PDFService._wrap(line, advances, rect.width - 2 * margin))
+        doc = fitz.open()
+        try:
+            resources = None
+            while True:
+                page_lines = list(islice(lines, per_page))
+                if not page_lines and doc.page_count:
+                    break
+                page = doc.new_page(width=rect.width, height=rect.height)
+                if resources is None:
+                    if buffer is None:
+                        page.insert_font(fontname=fontname)
+                    else:
+                        page.insert_font(fontname=fontname, fontbuffer=buffer)
+                    resources = doc.xref_get_key(page.xref, "Resources")[1]
+                else:
+                    doc.xref_set_key(page.xref, "Resources", resources)
+                content = head + "".join(f"<{encode(line)}> Tj T*\n" for line in page_lines) + "ET"
+                xref = doc.get_new_xref()
+                doc.update_object(xref, "<<>>")
+                doc.update_stream(xref, content.encode("ascii"), new=True)
+                doc.xref_set_key(page.xref, "Contents", f"{xref} 0 R")
+            if buffer is not None:
+                doc.subset_fonts()
+            output = BytesIO()
+            doc.save(output, garbage=3, deflate=True)
+            return output.getvalue()
+        finally:
+            doc.close()
     
     @staticmethod
     def file_to_pdf(file_content: bytes, mime_type: str) -> bytes:
@@ -46,15 +396,7 @@ class PDFService:
             os.remove("temp.pdf")
             return result
         elif mime_type == "text/plain":
-            if fitz is None:
-                raise ValueError("Text-to-PDF conversion is unavailable: install PyMuPDF")
-            doc = fitz.open()
-            page = doc.new_page()
-            page.insert_text((72, 72), "Text content conversion not fully implemented")
-            output = BytesIO()
-            doc.save(output)
-            doc.close()
-            return output.getvalue()
+            return PDFService.text_to_pdf(file_content)
         else:
             supported = "image/*, application/vnd.openxmlformats-officedocument.wordprocessingml.document (docx), text/plain"
             raise ValueError(f"Unsupported format: {mime_type}. Supported: {supported}")
@@ -0,0 +1,658 @@
+import pandas as pd
+import numpy as np
+from io import BytesIO
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.services.loader_service import TEXT_DTYPES, loader_service
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a threaded server process is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.ANALYSIS_PROFILE_WORKERS or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+def _column_stats(x: np.ndarray) -> np.ndarray:
+    """mean, std, min, max and skewness of every column of x (NaN-aware), as a 5 x k array."""
+    present = ~np.isnan(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = present.sum(axis=0)
+        mean = np.nansum(x, axis=0) / n
+        d = x - mean
+        m2 = np.nansum(d * d, axis=0)
+        m3 = np.nansum(d * d * d, axis=0)
+        std = np.sqrt(m2 / (n - 1))
+        # Population skewness, matching scipy.stats.skew(bias=True)
+        skew = (m3 / n) / (m2 / n) ** 1.5
+    std[n < 2] = np.nan
+    lo = x.min(axis=0, initial=np.inf, where=present)
+    hi = x.max(axis=0, initial=-np.inf, where=present)
+    lo[n == 0] = np.nan
+    hi[n == 0] = np.nan
+    return np.vstack([mean, std, lo, hi, skew])
+
+def _shared_column_stats(shm_name: str, shape: Tuple[int, int]) -> np.ndarray:
+    """Worker side: compute stats on a column block published in shared memory."""
+    shm = SharedMemory(name=shm_name)
+    try:
+        return _column_stats(np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F"))
+    finally:
+        shm.close()
+
+def as_text(series: pd.Series) -> pd.Series:
+    """Plain str/NaN object column, whatever dtype (category, Arrow string, bool...) it had."""
+    values = series.to_numpy(dtype=object, na_value=np.nan, copy=True)
+    present = ~pd.isna(values)
+    values[present] = values[present].astype(str)
+    return pd.Series(values, index=series.index, dtype=object, name=series.name)
+
+def _top_values(columns: Dict[str, pd.Series]) -> Dict[str, Dict[Any, int]]:
+    return {
+        col: {k: int(v) for k, v in series.value_counts().head(5).to_dict().items()}
+        for col, series in columns.items()
+    }
+
+class TopPairs:
+    """Keeps the k strongest (|r| above threshold) column pairs seen so far."""
+
+    def __init__(self, k: int, threshold: float):
+        self.k = k
+        self.threshold = threshold
+        self.values = np.zeros(0)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.cols = np.zeros(0, dtype=np.int64)
+
+    def add(self, corr: np.ndarray, row_offset: int = 0, col_offset: int = 0,
+            upper_only: bool = False):
+        """Add a block of the correlation matrix; upper_only for blocks on the diagonal."""
+        strength = np.abs(np.nan_to_num(corr, nan=0.0))
+        if upper_only:
+            strength = np.triu(strength, k=1)
+        i, j = np.nonzero(strength > self.threshold)
+        values = np.concatenate([self.values, corr[i, j]])
+        rows = np.concatenate([self.rows, i + row_offset])
+        cols = np.concatenate([self.cols, j + col_offset])
+        if len(values) > self.k:
+            keep = np.argpartition(-np.abs(values), self.k - 1)[:self.k]
+            values, rows, cols = values[keep], rows[keep], cols[keep]
+        self.values, self.rows, self.cols = values, rows, cols
+
+    def to_list(self, names: List[str]) -> List[Dict[str, Any]]:
+        order = np.argsort(-np.abs(self.values), kind="stable")
+        return [
+            {"feature1": names[self.rows[o]], "feature2": names[self.cols[o]],
+             "correlation": float(self.values[o])}
+            for o in order
+        ]
+
+class HeavyHitters:
+    """Misra-Gries top-k sketch. Counts are exact while distinct values fit in capacity.
+
+    After that they are lower bounds: every reduction subtracts a cutoff from all counters,
+    and ``error`` (the sum of cutoffs) bounds how far any count, including that of a value
+    that was dropped, can be below the truth. With many values of similar frequency the
+    sketch can end up empty.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+        self.error = 0
+
+    def update(self, counts: Dict[Any, int]):
+        for value, count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            # Subtract the (capacity+1)-th largest count so at most `capacity` keys survive
+            cutoff = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {k: v - cutoff for k, v in self.counts.items() if v > cutoff}
+            self.error += cutoff
+
+    def top(self, k: int) -> Dict[Any, int]:
+        return dict(sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:k])
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Bit length of every uint64 in x, by binary search over shifts."""
+    x = x.copy()
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= np.uint64(1 << shift)
+        x[high] >>= np.uint64(shift)
+        length[high] += shift
+    return length + (x > 0)
+
+class RowFingerprints:
+    """Counts duplicate rows from 64-bit row hashes.
+
+    Up to ``exact_rows`` rows the hashes are spilled to disk in hash buckets and counted
+    exactly. A HyperLogLog sketch of the same hashes is kept alongside; past the limit the
+    spill is dropped and duplicates are estimated from the sketch, so both the working set
+    and the persisted state stay bounded.
+    """
+
+    BUCKET_BITS = 8
+    HLL_BITS = 16  # 65,536 one-byte registers, about 0.4% standard error
+
+    def __init__(self, exact_rows: int):
+        self.exact_rows = exact_rows
+        self._dir: Optional[tempfile.TemporaryDirectory] = tempfile.TemporaryDirectory(prefix="profile_rows_")
+        self.rows = 0
+        self.registers = np.zeros(1 << self.HLL_BITS, dtype=np.uint8)
+
+    @property
+    def exact(self) -> bool:
+        return self._dir is not None
+
+    def _bucket_path(self, bucket: int) -> str:
+        return os.path.join(self._dir.name, f"{bucket:03d}.u64")
+
+    def update(self, hashes: np.ndarray):
+        self.rows += len(hashes)
+        p = self.HLL_BITS
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        # Rank: position of the first set bit after the index bits
+        rank = np.minimum(65 - _bit_length(hashes << np.uint64(p)), 64 - p + 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        self._spill(hashes)
+
+    def _spill(self, hashes: np.ndarray):
+        if self._dir is None:
+            return
+        if self.rows > self.exact_rows:
+            self._dir.cleanup()
+            self._dir = None
+            return
+        buckets = hashes >> np.uint64(64 - self.BUCKET_BITS)
+        order = np.argsort(buckets, kind="stable")
+        hashes, buckets = hashes[order], buckets[order]
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(hashes)]):
+            with open(self._bucket_path(int(buckets[start])), "ab") as f:
+                hashes[start:end].tofile(f)
+
+    def load(self, hashes: np.ndarray, registers: np.ndarray, rows: int):
+        """Restore from distinct() output, the sketch registers and the total row count."""
+        self.registers = registers.copy()
+        self.rows = rows
+        self._spill(hashes)
+
+    def distinct(self) -> np.ndarray:
+        """All distinct fingerprints, sorted; empty once the exact limit has been passed."""
+        if self._dir is None:
+            return np.zeros(0, dtype=np.uint64)
+        parts = [
+            np.unique(np.fromfile(os.path.join(self._dir.name, name), dtype=np.uint64))
+            for name in sorted(os.listdir(self._dir.name))
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64)
+
+    def distinct_estimate(self) -> float:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / float(np.ldexp(1.0, -self.registers.astype(np.int64)).sum())
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting is more accurate for small sets
+        return raw
+
+    def duplicate_count(self) -> int:
+        """Rows minus distinct fingerprints; only one bucket is in memory at a time."""
+        if self._dir is None:
+            return max(self.rows - int(round(self.distinct_estimate())), 0)
+        distinct = 0
+        for name in os.listdir(self._dir.name):
+            distinct += len(np.unique(np.fromfile(os.path.join(self._dir.name, name), dtype=np.uint64)))
+        return self.rows - distinct
+
+    def close(self):
+        if self._dir is not None:
+            self._dir.cleanup()
+
+class DatasetProfile:
+    """Mergeable column aggregates built one chunk at a time.
+
+    Everything kept is bounded: co-moments cover the first ``ANALYSIS_STREAM_CORR_COLUMNS``
+    numeric columns and row fingerprints stop being exact past ``ANALYSIS_EXACT_DUPLICATE_ROWS``.
+    """
+
+    def __init__(self, columns: List[str], numeric_cols: List[str], categorical_cols: List[str],
+                 sketch_capacity: int):
+        self.columns = columns
+        self.numeric_cols = numeric_cols
+        self.categorical_cols = categorical_cols
+        self.rows = 0
+        self.memory_bytes = 0
+        self.null_counts = np.zeros(len(columns), dtype=np.int64)
+        self.sample: Optional[pd.DataFrame] = None
+
+        # Per numeric column: count, mean and central moment sums (Welford/Pebay)
+        p = len(numeric_cols)
+        self.n = np.zeros(p)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.m3 = np.zeros(p)
+        self.min = np.full(p, np.nan)
+        self.max = np.full(p, np.nan)
+
+        # Pairwise-complete co-moment sums around a fixed shift, for correlations. They grow
+        # with the square of the column count, so wide frames only keep the first columns
+        self.pair_cols = numeric_cols[:settings.ANALYSIS_STREAM_CORR_COLUMNS]
+        q = len(self.pair_cols)
+        self.shift: Optional[np.ndarray] = None
+        self.pair_n = np.zeros((q, q))
+        self.pair_sum = np.zeros((q, q))
+        self.pair_sumsq = np.zeros((q, q))
+        self.pair_cross = np.zeros((q, q))
+
+        self.sketches = {col: HeavyHitters(sketch_capacity) for col in categorical_cols}
+        self.fingerprints = RowFingerprints(settings.ANALYSIS_EXACT_DUPLICATE_ROWS)
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        self.memory_bytes += int(chunk.memory_usage(deep=True).sum())
+        self.null_counts += chunk[self.columns].isnull().sum().to_numpy()
+        self.fingerprints.update(
+            pd.util.hash_pandas_object(chunk[self.columns], index=False).to_numpy()
+        )
+        for col in self.categorical_cols:
+            self.sketches[col].update(chunk[col].value_counts().to_dict())
+        if self.numeric_cols:
+            self._update_numeric(chunk[self.numeric_cols].to_numpy(dtype=np.float64))
+
+    def _update_numeric(self, x: np.ndarray):
+        present = ~np.isnan(x)
+        n_b = present.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(n_b > 0, np.nansum(x, axis=0) / n_b, 0.0)
+            d = x - mean_b
+            m2_b = np.nansum(d ** 2, axis=0)
+            m3_b = np.nansum(d ** 3, axis=0)
+            self._merge_moments(n_b, mean_b, m2_b, m3_b)
+        # fmin/fmax skip the NaN of columns with no values yet
+        self.min = np.fmin(self.min, x.min(axis=0, initial=np.inf, where=present))
+        self.max = np.fmax(self.max, x.max(axis=0, initial=-np.inf, where=present))
+        self.min[np.isinf(self.min)] = np.nan
+        self.max[np.isinf(self.max)] = np.nan
+
+        q = len(self.pair_cols)
+        x, present = x[:, :q], present[:, :q]
+        if self.shift is None:
+            self.shift = mean_b[:q]
+        shifted = np.where(present, x - self.shift, 0.0)
+        mask = present.astype(np.float64)
+        self.pair_n += mask.T @ mask
+        self.pair_sum += shifted.T @ mask
+        self.pair_sumsq += (shifted ** 2).T @ mask
+        self.pair_cross += shifted.T @ shifted
+
+    def _merge_moments(self, n_b, mean_b, m2_b, m3_b):
+        n_a, mean_a, m2_a, m3_a = self.n, self.mean, self.m2, self.m3
+        n = n_a + n_b
+        safe_n = np.where(n > 0, n, 1.0)
+        delta = mean_b - mean_a
+        self.mean = mean_a + delta * n_b / safe_n
+        self.m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / safe_n
+        self.m3 = (m3_a + m3_b
+                   + delta ** 3 * n_a * n_b * (n_a - n_b) / safe_n ** 2
+                   + 3 * delta * (n_a * m2_b - n_b * m2_a) / safe_n)
+        self.n = n
+
+    def numeric_stats(self) -> Dict[str, Dict[str, float]]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self.n > 0, self.mean, np.nan)
+            std = np.sqrt(self.m2 / (self.n - 1))
+            std[self.n < 2] = np.nan
+            # Population skewness, matching scipy.stats.skew(bias=True)
+            skew = (self.m3 / self.n) / (self.m2 / self.n) ** 1.5
+        return {
+            col: {
+                "mean": float(mean[i]),
+                "std": float(std[i]),
+                "min": float(self.min[i]),
+                "max": float(self.max[i]),
+                "skewness": float(skew[i]),
+            } for i, col in enumerate(self.numeric_cols)
+        }
+
+    def correlation_matrix(self) -> pd.DataFrame:
+        """Pearson correlations over pairwise-complete rows, like DataFrame.corr()."""
+        n, s, q, c = self.pair_n, self.pair_sum, self.pair_sumsq, self.pair_cross
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * c - s * s.T
+            var = (n * q - s ** 2) * (n * q.T - s.T ** 2)
+            corr = cov / np.sqrt(var)
+        corr[n < 2] = np.nan
+        return pd.DataFrame(np.clip(corr, -1, 1), index=self.pair_cols, columns=self.pair_cols)
+
+    def summary(self) -> Dict[str, Any]:
+        """Summary in the same shape as AnalysisService.analyze_frame (without insights)."""
+        summary = {
+            "rows": self.rows,
+            "columns": len(self.columns),
+            "missing_values": int(self.null_counts.sum()),
+            "duplicate_rows": self.fingerprints.duplicate_count(),
+            "memory_usage_mb": self.memory_bytes / 1024**2
+        }
+        if not self.fingerprints.exact:
+            summary["duplicate_rows_estimated"] = True
+        if self.numeric_cols:
+            summary["numeric_stats"] = self.numeric_stats()
+        if self.categorical_cols:
+            summary["categorical_stats"] = {
+                col: {k: int(v) for k, v in sketch.top(5).items()}
+                for col, sketch in self.sketches.items()
+            }
+            errors = {col: sketch.error for col, sketch in self.sketches.items() if sketch.error}
+            if errors:
+                # Those columns' counts are lower bounds, short by at most this much
+                summary["categorical_count_error"] = errors
+        return summary
+
+    def to_bytes(self) -> bytes:
+        """Serialize the aggregates (not the data) so later appends can resume from them."""
+        meta = {
+            "columns": self.columns,
+            "numeric_cols": self.numeric_cols,
+            "categorical_cols": self.categorical_cols,
+            "pair_cols": self.pair_cols,
+            "rows": self.rows,
+            "memory_bytes": self.memory_bytes,
+            "sketch_capacity": next(iter(self.sketches.values())).capacity if self.sketches else 0,
+            "sketches": {col: list(sketch.counts.items()) for col, sketch in self.sketches.items()},
+            "sketch_errors": {col: sketch.error for col, sketch in self.sketches.items()},
+            "sample": self.sample.to_dict(orient="split") if self.sample is not None else None,
+        }
+        buffer = BytesIO()
+        np.savez_compressed(
+            buffer,
+            meta=np.frombuffer(json.dumps(meta, default=str).encode('utf-8'), dtype=np.uint8),
+            null_counts=self.null_counts,
+            n=self.n, mean=self.mean, m2=self.m2, m3=self.m3, min=self.min, max=self.max,
+            shift=self.shift if self.shift is not None else np.zeros(0),
+            pair_n=self.pair_n, pair_sum=self.pair_sum,
+            pair_sumsq=self.pair_sumsq, pair_cross=self.pair_cross,
+            fingerprints=self.fingerprints.distinct(),
+            fingerprint_registers=self.fingerprints.registers,
+            fingerprint_rows=np.array([self.fingerprints.rows], dtype=np.int64),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DatasetProfile":
+        arrays = np.load(BytesIO(data))
+        meta = json.loads(arrays["meta"].tobytes().decode('utf-8'))
+        profile = cls(meta["columns"], meta["numeric_cols"], meta["categorical_cols"],
+                      meta["sketch_capacity"])
+        profile.pair_cols = meta["pair_cols"]
+        profile.rows = meta["rows"]
+        profile.memory_bytes = meta["memory_bytes"]
+        for col, counts in meta["sketches"].items():
+            profile.sketches[col].counts = dict((value, count) for value, count in counts)
+            profile.sketches[col].error = meta["sketch_errors"][col]
+        if meta["sample"] is not None:
+            sample = meta["sample"]
+            profile.sample = pd.DataFrame(sample["data"], index=sample["index"], columns=sample["columns"])
+        for name in ("null_counts", "n", "mean", "m2", "m3", "min", "max",
+                     "pair_n", "pair_sum", "pair_sumsq", "pair_cross"):
+            setattr(profile, name, arrays[name])
+        profile.shift = arrays["shift"] if len(arrays["shift"]) else None
+        profile.fingerprints.load(arrays["fingerprints"], arrays["fingerprint_registers"],
+                                  int(arrays["fingerprint_rows"][0]))
+        return profile
+
+    def close(self):
+        self.fingerprints.close()
+
+class ProfilingService:
+    @staticmethod
+    def _normalize(chunk: pd.DataFrame, profile: DatasetProfile) -> pd.DataFrame:
+        """Coerce a chunk to the profile's schema so every chunk hashes and counts alike."""
+        chunk = chunk.copy()
+        for col in profile.numeric_cols:
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").astype(np.float64)
+        for col in profile.categorical_cols:
+            if chunk[col].dtype != object:
+                chunk[col] = as_text(chunk[col])
+        typed = set(profile.numeric_cols) | set(profile.categorical_cols)
+        for col in profile.columns:
+            if col not in typed:
+                chunk[col] = ProfilingService._canonical_text(chunk[col])
+        return chunk
+
+    @staticmethod
+    def _canonical_text(s: pd.Series) -> pd.Series:
+        """One text form per value for columns that are neither numeric nor text (dates, flags...).
+
+        A date hashes the same whether a loader parsed it or kept the original string.
+        """
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
+            parsed = s
+        elif pd.api.types.infer_dtype(s, skipna=True) in ("string", "datetime", "datetime64", "date"):
+            parsed = pd.to_datetime(s, errors="coerce", format="ISO8601")
+            if parsed.notna().sum() != s.notna().sum():
+                return as_text(s)
+        else:
+            return as_text(s)
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_convert("UTC").dt.tz_localize(None)
+        return as_text(parsed.dt.strftime("%Y-%m-%dT%H:%M:%S.%f"))
+
+    @staticmethod
+    def profile_csv(source: BinaryIO, chunk_rows: Optional[int] = None,
+                    profile: Optional[DatasetProfile] = None,
+                    on_chunk: Optional[Callable[[pd.DataFrame], None]] = None) -> DatasetProfile:
+        """Profile a CSV stream chunk by chunk; memory is bounded by the chunk size.
+
+        Passing an existing profile appends the stream's rows to it instead of starting over.
+        ``on_chunk`` receives every chunk as read, e.g. to write it out as Parquet.
+        """
+        chunk_rows = chunk_rows or settings.ANALYSIS_CHUNK_ROWS
+        start = source.tell()
+        if profile is None:
+            head = pd.read_csv(source, nrows=chunk_rows)
+            profile = DatasetProfile(
+                head.columns.tolist(),
+                head.select_dtypes(include=[np.number]).columns.tolist(),
+                head.select_dtypes(include=TEXT_DTYPES).columns.tolist(),
+                settings.ANALYSIS_SKETCH_CAPACITY,
+            )
+            del head
+        else:
+            header = pd.read_csv(source, nrows=0).columns.tolist()
+            if header != profile.columns:
+                raise ValueError("Appended data columns do not match the analyzed dataset")
+        source.seek(start)
+
+        # Exact float parsing keeps row fingerprints identical to the Arrow parser's
+        reader = pd.read_csv(source, chunksize=chunk_rows, float_precision="round_trip",
+                             dtype={c: str for c in profile.categorical_cols})
+        return ProfilingService.profile_chunks(reader, profile, on_chunk)
+
+    @staticmethod
+    def profile_chunks(chunks: Iterable[pd.DataFrame], profile: Optional[DatasetProfile] = None,
+                       on_chunk: Optional[Callable[[pd.DataFrame], None]] = None) -> DatasetProfile:
+        """Profile DataFrame chunks from any reader; without a profile the first chunk fixes the types."""
+        for chunk in chunks:
+            if profile is None:
+                profile = DatasetProfile(
+                    chunk.columns.tolist(),
+                    chunk.select_dtypes(include=[np.number]).columns.tolist(),
+                    chunk.select_dtypes(include=TEXT_DTYPES).columns.tolist(),
+                    settings.ANALYSIS_SKETCH_CAPACITY,
+                )
+            elif chunk.columns.tolist() != profile.columns:
+                raise ValueError("Appended data columns do not match the analyzed dataset")
+            if profile.sample is None:
+                profile.sample = chunk.head(5).copy()
+            if on_chunk is not None:
+                on_chunk(chunk)  # before normalizing, so stored rows keep their original types
+            profile.update(ProfilingService._normalize(chunk, profile))
+        return profile
+
+    @staticmethod
+    def sample_chunks(chunks: Iterable[pd.DataFrame], size: int,
+                      seed: Optional[int] = None) -> Tuple[Optional[pd.DataFrame], int]:
+        """Uniform reservoir sample of DataFrame chunks in one pass; returns (sample, total rows).
+
+        Each row gets a random key and the reservoir keeps the smallest ``size`` keys,
+        which is a uniform sample without replacement that can be updated per chunk.
+        The sample is None when there were no chunks.
+        """
+        rng = np.random.default_rng(seed)
+        reservoir: Optional[pd.DataFrame] = None
+        keys = np.empty(0)
+        total = 0
+        for chunk in chunks:
+            total += len(chunk)
+            chunk_keys = rng.random(len(chunk))
+            if reservoir is not None and len(keys) >= size:
+                # Only rows that beat the current worst key can enter the reservoir
+                chunk = chunk[chunk_keys < keys.max()]
+                chunk_keys = chunk_keys[chunk_keys < keys.max()]
+                if chunk.empty:
+                    continue
+            candidates = chunk if reservoir is None else pd.concat([reservoir, chunk])
+            keys = np.concatenate([keys, chunk_keys])
+            keep = np.argsort(keys, kind="stable")[:size]
+            reservoir, keys = candidates.iloc[keep], keys[keep]
+        if reservoir is None:
+            return None, 0
+        # Restore source order so the sample reads like the source
+        return reservoir.sort_index(kind="stable").reset_index(drop=True), total
+
+    @staticmethod
+    def sample_csv(source: BinaryIO, size: int, chunk_rows: Optional[int] = None,
+                   seed: Optional[int] = None) -> Tuple[pd.DataFrame, int]:
+        """Uniform reservoir sample of a CSV stream in one pass; returns (sample, total rows)."""
+        chunk_rows = chunk_rows or settings.ANALYSIS_CHUNK_ROWS
+        start = source.tell()
+        reader = pd.read_csv(source, chunksize=chunk_rows, float_precision="round_trip")
+        sample, total = ProfilingService.sample_chunks(reader, size, seed)
+        if sample is None:
+            source.seek(start)
+            return pd.read_csv(source, nrows=0), 0
+        return sample, total
+
+    @staticmethod
+    def sample_excel(source: BinaryIO, size: int, sheet: Optional[str] = None,
+                     seed: Optional[int] = None) -> Tuple[pd.DataFrame, int]:
+        """Uniform reservoir sample of one worksheet, read in openpyxl row batches.
+
+        Only the reservoir and one batch are in memory; the sample gets the loader's
+        compact dtypes, as a fully loaded sheet would.
+        """
+        sample, total = ProfilingService.sample_chunks(loader_service.iter_excel(source, sheet), size, seed)
+        return loader_service.compact(sample), total
+
+    @staticmethod
+    def _use_pool(df: pd.DataFrame, cols: List[str]) -> bool:
+        return (len(cols) > settings.ANALYSIS_SHARD_COLUMNS
+                and len(df) * len(cols) >= settings.ANALYSIS_PARALLEL_MIN_CELLS)
+
+    @staticmethod
+    def numeric_stats(df: pd.DataFrame, numeric_cols: List[str]) -> Dict[str, Dict[str, float]]:
+        """Per-column stats via vectorized reductions over column blocks.
+
+        Wide frames are sharded across the process pool; each block's column buffers are
+        copied once into shared memory instead of being pickled to the worker.
+        """
+        width = settings.ANALYSIS_SHARD_COLUMNS
+        blocks = [numeric_cols[i:i + width] for i in range(0, len(numeric_cols), width)]
+        results: List[np.ndarray] = []
+        if not ProfilingService._use_pool(df, numeric_cols):
+            for block in blocks:
+                results.append(_column_stats(df[block].to_numpy(dtype=np.float64, na_value=np.nan)))
+        else:
+            pool = _get_pool()
+            segments, futures = [], []
+            try:
+                for block in blocks:
+                    shape = (len(df), len(block))
+                    shm = SharedMemory(create=True, size=max(8 * shape[0] * shape[1], 1))
+                    segments.append(shm)
+                    # Column-major so every column is one contiguous buffer
+                    buf = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F")
+                    for j, col in enumerate(block):
+                        buf[:, j] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                    del buf
+                    futures.append(pool.submit(_shared_column_stats, shm.name, shape))
+                results = [f.result() for f in futures]
+            finally:
+                for shm in segments:
+                    shm.close()
+                    shm.unlink()
+
+        stats = np.hstack(results) if results else np.zeros((5, 0))
+        names = ("mean", "std", "min", "max", "skewness")
+        return {
+            col: {name: float(stats[k, i]) for k, name in enumerate(names)}
+            for i, col in enumerate(numeric_cols)
+        }
+
+    @staticmethod
+    def categorical_stats(df: pd.DataFrame, cat_cols: List[str]) -> Dict[str, Dict[Any, int]]:
+        """Top-5 value counts per column, sharded across the process pool for wide frames."""
+        if not ProfilingService._use_pool(df, cat_cols):
+            return _top_values({col: df[col] for col in cat_cols})
+        width = settings.ANALYSIS_SHARD_COLUMNS
+        pool = _get_pool()
+        futures = [
+            pool.submit(_top_values, {col: df[col] for col in cat_cols[i:i + width]})
+            for i in range(0, len(cat_cols), width)
+        ]
+        result = {}
+        for future in futures:
+            result.update(future.result())
+        return result
+
+    @staticmethod
+    def top_correlations(df: pd.DataFrame, cols: List[str], k: int, threshold: float,
+                         method: str = "pearson") -> List[Dict[str, Any]]:
+        """Strongest correlated pairs, computed block by block.
+
+        Only one block x block slice of the correlation matrix exists at a time, so very
+        wide frames never materialize all n^2 coefficients. NaNs are handled
+        pairwise-complete, like DataFrame.corr(). Spearman ranks each column once, which
+        matches pandas exactly when there are no missing values.
+        """
+        data = df[cols].rank() if method == "spearman" else df[cols]
+        width = settings.ANALYSIS_CORR_BLOCK_COLUMNS
+        top = TopPairs(k, threshold)
+
+        def block(start: int) -> Tuple[np.ndarray, np.ndarray]:
+            x = data.iloc[:, start:start + width].to_numpy(dtype=np.float64, na_value=np.nan)
+            present = ~np.isnan(x)
+            with np.errstate(invalid="ignore"):
+                x = x - np.nanmean(x, axis=0)  # center for numerical stability
+            return np.where(present, x, 0.0), present.astype(np.float64)
+
+        for i in range(0, len(cols), width):
+            xi, mi = block(i)
+            for j in range(i, len(cols), width):
+                xj, mj = (xi, mi) if j == i else block(j)
+                n = mi.T @ mj
+                si, sj = xi.T @ mj, mi.T @ xj
+                qi, qj = (xi * xi).T @ mj, mi.T @ (xj * xj)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    corr = (n * (xi.T @ xj) - si * sj) / np.sqrt((n * qi - si ** 2) * (n * qj - sj ** 2))
+                corr[n < 2] = np.nan
+                top.add(np.clip(corr, -1, 1), i, j, upper_only=(i == j))
+        return top.to_list(cols)
+
+profiling_service = ProfilingService()
@@ -1,40 +1,245 @@
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import sent_tokenize, word_tokenize
 from collections import Counter
+from functools import lru_cache
 from heapq import nlargest
+from typing import Any, Callable, Dict, FrozenSet, List
+from app.core.config import settings
+import logging
 import re
+import time
 
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
+logger = logging.getLogger(__name__)
+
+# Used when the NLTK stopwords corpus is not provisioned
+FALLBACK_STOPWORDS = frozenset("""
+a about above after again against ain all am an and any are aren aren't as at be because been
+before being below between both but by can couldn couldn't d did didn didn't do does doesn
+doesn't doing don don't down during each few for from further had hadn hadn't has hasn hasn't
+have haven haven't having he her here hers herself him himself his how i if in into is isn
+isn't it it's its itself just ll m ma me mightn mightn't more most mustn mustn't my myself
+needn needn't no nor not now o of off on once only or other our ours ourselves out over own re
+s same shan shan't she she's should should've shouldn shouldn't so some such t than that
+that'll the their theirs them themselves then there these they this those through to too
+under until up ve very was wasn wasn't we were weren weren't what when where which while who
+whom why will with won won't wouldn wouldn't y you you'd you'll you're you've your yours
+yourself yourselves
+""".split())
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+_WORD = re.compile(r"\w+(?:'\w+)?|[^\w\s]")
+
+def _fallback_sent_tokenize(text: str) -> List[str]:
+    return [s for s in _SENTENCE_END.split(text.strip()) if s]
+
+def _fallback_word_tokenize(text: str) -> List[str]:
+    return _WORD.findall(text)
+
+class TextResources:
+    """Tokenizers and stopwords, backed by NLTK data when it is installed locally."""
+
+    def __init__(self, sent_tokenize: Callable[[str], List[str]],
+                 word_tokenize: Callable[[str], List[str]],
+                 stop_words: FrozenSet[str], source: str):
+        self.sent_tokenize = sent_tokenize
+        self.word_tokenize = word_tokenize
+        self.stop_words = stop_words
+        self.source = source
+
+@lru_cache(maxsize=None)
+def get_text_resources() -> TextResources:
+    """Load text resources once per process. Never downloads; falls back to regex tokenizers."""
+    try:
+        import nltk
+        from nltk.corpus import stopwords
+    except ImportError:
+        return TextResources(_fallback_sent_tokenize, _fallback_word_tokenize,
+                             FALLBACK_STOPWORDS, "fallback")
+    
+    if settings.NLTK_DATA_DIR and settings.NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, settings.NLTK_DATA_DIR)
+    
+    try:
+        nltk.sent_tokenize("Warm up. Done.")
+        sent_tokenize, word_tokenize, source = nltk.sent_tokenize, nltk.word_tokenize, "nltk"
+    except LookupError:
+        logger.warning("NLTK punkt data not found; using fallback tokenizer")
+        sent_tokenize, word_tokenize, source = _fallback_sent_tokenize, _fallback_word_tokenize, "fallback"
+    
+    try:
+        stop_words = frozenset(stopwords.words('english'))
+    except LookupError:
+        logger.warning("NLTK stopwords not found; using bundled list")
+        stop_words = FALLBACK_STOPWORDS
+    
+    return TextResources(sent_tokenize, word_tokenize, stop_words, source)
+
+class SentenceChunker:
+    """Incrementally groups streamed text into sentence-aligned chunks."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._tail = ""
+        self._sentences: List[str] = []
+        self._size = 0
+
+    def feed(self, text: str) -> List[str]:
+        """Add text and return any chunks that are complete."""
+        buffer = self._tail + text
+        sentences = get_text_resources().sent_tokenize(buffer)
+        # The last sentence may continue in the next read, so carry it over
+        self._tail = sentences.pop() if sentences else ""
+        if buffer[-1:].isspace():
+            self._tail += ' '
+        chunks = []
+        for sentence in sentences:
+            chunks.extend(self._add(sentence))
+        # A run-on "sentence" must not grow without bound
+        while len(self._tail) > self.max_chars:
+            chunks.extend(self._add(self._tail[:self.max_chars]))
+            self._tail = self._tail[self.max_chars:]
+        return chunks
+
+    def flush(self) -> List[str]:
+        """Return the remaining text as final chunk(s)."""
+        tail = self._tail.strip()
+        chunks = self._add(tail) if tail else []
+        self._tail = ""
+        if self._sentences:
+            chunks.append(' '.join(self._sentences))
+            self._sentences, self._size = [], 0
+        return chunks
+
+    def _add(self, sentence: str) -> List[str]:
+        chunks = []
+        if self._sentences and self._size + len(sentence) > self.max_chars:
+            chunks.append(' '.join(self._sentences))
+            self._sentences, self._size = [], 0
+        self._sentences.append(sentence)
+        self._size += len(sentence) + 1
+        return chunks
 
 class SummarizationService:
     @staticmethod
     def extractive_summary(text: str, ratio: float = 0.3) -> str:
         """Extractive summarization using TF-IDF scoring."""
-        sentences = sent_tokenize(text)
-        if len(sentences) < 2:
-            return text[:500]
+        return SummarizationService.summarize(text, ratio)["summary"]
+
+    @staticmethod
+    def summarize(text: str, ratio: float = 0.3, top_k: int = 0) -> Dict[str, Any]:
+        """Extractive summary, plus top_k keywords and keyphrases from the same token pass."""
+        resources = get_text_resources()
+        sentences = resources.sent_tokenize(text)
+        if len(sentences) < 2 and not top_k:
+            return {"summary": text[:500]}
         
-        stop_words = set(stopwords.words('english'))
-        words = word_tokenize(text.lower())
-        words = [w for w in words if w.isalnum() and w not in stop_words]
+        stop_words = resources.stop_words
+        sentence_tokens = [resources.word_tokenize(sentence.lower()) for sentence in sentences]
+        word_freq = Counter(
+            w for tokens in sentence_tokens for w in tokens
+            if w.isalnum() and w not in stop_words
+        )
+        total_words = sum(word_freq.values())
         
-        word_freq = Counter(words)
-        total_words = len(words)
+        if len(sentences) < 2:
+            summary = text[:500]
+        else:
+            sentence_scores = {}
+            for sentence, tokens in zip(sentences, sentence_tokens):
+                for word in tokens:
+                    if word in word_freq:
+                        sentence_scores[sentence] = (
+                            sentence_scores.get(sentence, 0) + word_freq[word] / total_words
+                        )
+            summary_sentences = nlargest(int(len(sentences) * ratio),
+                                         sentence_scores, key=sentence_scores.get)
+            summary = ' '.join(summary_sentences)
         
-        sentence_scores = {}
-        for sentence in sentences:
-            for word in word_tokenize(sentence.lower()):
+        result = {"summary": summary}
+        if top_k:
+            result["keywords"] = [
+                {"term": w, "count": c} for w, c in word_freq.most_common(top_k)
+            ]
+            result["keyphrases"] = SummarizationService._keyphrases(
+                sentence_tokens, word_freq, top_k
+            )
+        return result
+
+    @staticmethod
+    def _keyphrases(sentence_tokens: List[List[str]], word_freq: Counter, top_k: int,
+                    max_words: int = 4) -> List[Dict[str, Any]]:
+        """RAKE-style phrases: runs of content words split at stopwords and punctuation."""
+        phrases = Counter()
+        for tokens in sentence_tokens:
+            run = []
+            for word in tokens + [""]:
                 if word in word_freq:
-                    if sentence not in sentence_scores:
-                        sentence_scores[sentence] = word_freq[word] / total_words
-                    else:
-                        sentence_scores[sentence] += word_freq[word] / total_words
+                    run.append(word)
+                    continue
+                if run:
+                    if len(run) <= max_words:
+                        phrases[tuple(run)] += 1
+                    run = []
         
-        summary_sentences = nlargest(int(len(sentences) * ratio), 
-                                   sentence_scores, key=sentence_scores.get)
+        # Word frequency is shared with the summary; only co-occurrence degree is new
+        degree = Counter()
+        for phrase, count in phrases.items():
+            for word in phrase:
+                degree[word] += len(phrase) * count
         
-        return ' '.join(summary_sentences)
+        scored = {
+            ' '.join(phrase): sum(degree[w] / word_freq[w] for w in phrase)
+            for phrase in phrases
+        }
+        return [
+            {"phrase": phrase, "score": round(score, 3)}
+            for phrase, score in nlargest(top_k, scored.items(), key=lambda kv: kv[1])
+        ]
+
+    @staticmethod
+    def merge_keywords(results: List[Dict[str, Any]], top_k: int) -> Dict[str, Any]:
+        """Combine keywords/keyphrases from per-chunk results (map-reduce mode)."""
+        counts = Counter()
+        scores = Counter()
+        for result in results:
+            for item in result.get("keywords", []):
+                counts[item["term"]] += item["count"]
+            for item in result.get("keyphrases", []):
+                scores[item["phrase"]] += item["score"]
+        return {
+            "keywords": [{"term": w, "count": c} for w, c in counts.most_common(top_k)],
+            "keyphrases": [
+                {"phrase": p, "score": round(sc, 3)} for p, sc in scores.most_common(top_k)
+            ],
+        }
+
+    @staticmethod
+    def estimate_cost(text: str) -> Dict[str, int]:
+        """Cheap size estimate (no tokenization) used to route work inline or to the queue."""
+        return {"chars": len(text), "sentences": len(_SENTENCE_END.findall(text)) + 1}
+
+    @staticmethod
+    def reduce_summaries(chunk_summaries: List[str], max_chars: int, ratio: float = 0.3) -> str:
+        """Combine per-chunk summaries, re-summarizing until the result fits max_chars."""
+        summary = ' '.join(s for s in chunk_summaries if s)
+        while len(summary) > max_chars:
+            reduced = SummarizationService.extractive_summary(summary, ratio)
+            if not reduced or len(reduced) >= len(summary):
+                return summary[:max_chars]
+            summary = reduced
+        return summary
+
+    @staticmethod
+    def warm_up() -> float:
+        """Load tokenizer resources now and return the time taken in milliseconds."""
+        start = time.perf_counter()
+        resources = get_text_resources()
+        SummarizationService.extractive_summary("Warm up the tokenizer. It runs once per process.")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > settings.SUMMARY_WARMUP_BUDGET_MS:
+            logger.warning("Summarizer warm-up took %.0f ms (budget %d ms)",
+                           elapsed_ms, settings.SUMMARY_WARMUP_BUDGET_MS)
+        else:
+            logger.info("Summarizer warm-up took %.0f ms using %s resources",
+                        elapsed_ms, resources.source)
+        return elapsed_ms
 
 summarization_service = SummarizationService()
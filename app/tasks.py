@@ -1,50 +1,187 @@
+from celery import chord
+from celery.signals import worker_process_init
 from celery_app import app
 from app.services.summarization_service import summarization_service
 from app.services.minio_service import minio_service
+from app.services.analysis_service import analysis_service
 from app.models.job import Job, JobStatus
+from app.models.file import File as FileModel
+from app.models.file_version import FileVersion
+from app.models.analysis_cache import AnalysisCache
 from app.core.config import settings
+import json
 import uuid
-from sqlalchemy import create_engine
+from typing import Any, Dict, List, Optional
+from sqlalchemy import create_engine, delete
 from sqlalchemy.orm import Session
 
 # Sync engine for Celery tasks (asyncpg doesn't work in sync context)
 sync_db_url = settings.DATABASE_URL.replace("+asyncpg", "")
 sync_engine = create_engine(sync_db_url)
 
+@worker_process_init.connect
+def _warm_up_summarizer(**kwargs):
+    # Load tokenizer resources once per worker process, not per task
+    summarization_service.warm_up()
+
+def upload_summary(job_id: str, result: Dict[str, Any]) -> str:
+    """Upload a finished summary and return its presigned URL."""
+    if "keywords" in result:
+        # Keyword results need structure, so store the whole result as JSON
+        filename = f"summary_{job_id}.json"
+        summary_bytes = json.dumps(result, indent=2).encode('utf-8')
+    else:
+        filename = f"summary_{job_id}.txt"
+        summary_bytes = result["summary"].encode('utf-8')
+    object_name = minio_service.upload_file(
+        filename=filename,
+        file_content=summary_bytes,
+        metadata={'type': 'summarization_result', 'job_id': job_id}
+    )
+    return minio_service.get_presigned_url(object_name)
+
+def _store_summary(job_id: str, result: Dict[str, Any]) -> str:
+    """Upload a finished summary and mark its job completed."""
+    result_url = upload_summary(job_id, result)
+    
+    # Update job in DB using sync session
+    with Session(sync_engine) as db:
+        job = db.get(Job, job_id)
+        if job:
+            job.status = JobStatus.COMPLETED
+            job.result_url = result_url
+            db.commit()
+    return result_url
+
+def _fail_job(job_id: str, exc: Exception):
+    with Session(sync_engine) as db:
+        job = db.get(Job, job_id)
+        if job:
+            job.status = JobStatus.FAILED
+            job.error_message = str(exc)
+            db.commit()
+
 @app.task(bind=True, max_retries=3)
-def process_summarization(self, job_id: str, text: str, user_id: int):
+def process_summarization(self, job_id: str, text: str, user_id: int, keywords: int = 0):
     """Background summarization task."""
     try:
-        # Generate summary
-        summary = summarization_service.extractive_summary(text)
-        
-        # Save summary to MinIO
-        filename = f"summary_{job_id}.txt"
-        summary_bytes = summary.encode('utf-8')
-        object_name = minio_service.upload_file(
-            filename=filename,
-            file_content=summary_bytes,
-            metadata={'type': 'summarization_result', 'job_id': job_id}
-        )
-        result_url = minio_service.get_presigned_url(object_name)
-        
-        # Update job in DB using sync session
-        with Session(sync_engine) as db:
-            job = db.get(Job, job_id)
-            if job:
-                job.status = JobStatus.COMPLETED
-                job.result_url = result_url
-                db.commit()
-        
+        # Generate summary (and keywords, from the same token pass)
+        result = summarization_service.summarize(text, top_k=keywords)
+        result_url = _store_summary(job_id, result)
         return {"job_id": job_id, "result_url": result_url, "status": "completed"}
         
     except Exception as exc:
         # Update job as failed
+        _fail_job(job_id, exc)
+        raise self.retry(exc=exc, countdown=5)
+
+@app.task(bind=True, max_retries=3)
+def summarize_chunk(self, job_id: str, chunk_object: str, keywords: int = 0) -> Dict[str, Any]:
+    """Map step: summarize one sentence-aligned chunk of a large document, stored in MinIO."""
+    try:
+        content = minio_service.download_file(chunk_object)
+        if content is None:
+            raise ValueError("Document chunk not found in storage")
+        chunk = content.decode('utf-8')
+        # Over-fetch keyword candidates so the merged top-k stays accurate
+        return summarization_service.summarize(chunk, top_k=keywords * 3)
+    except Exception as exc:
+        _fail_job(job_id, exc)
+        raise self.retry(exc=exc, countdown=5)
+
+@app.task(bind=True, max_retries=3)
+def reduce_chunk_summaries(self, chunk_results: List[Dict[str, Any]], job_id: str, user_id: int,
+                           keywords: int = 0, chunk_objects: Optional[List[str]] = None):
+    """Reduce step: merge the ordered chunk summaries into the final summary."""
+    try:
+        result = {"summary": summarization_service.reduce_summaries(
+            [r["summary"] for r in chunk_results], max_chars=settings.SUMMARY_CHUNK_CHARS
+        )}
+        if keywords:
+            result.update(summarization_service.merge_keywords(chunk_results, keywords))
+        result_url = _store_summary(job_id, result)
+        for chunk_object in chunk_objects or []:
+            minio_service.delete_file(chunk_object)  # kept until now so map retries can re-read them
+        return {"job_id": job_id, "result_url": result_url, "status": "completed"}
+    except Exception as exc:
+        _fail_job(job_id, exc)
+        raise self.retry(exc=exc, countdown=5)
+
+def queue_map_reduce_summarization(job_id: str, chunk_objects: List[str], user_id: int, keywords: int = 0):
+    """Fan stored chunks out to parallel map tasks and chain the reduce pass after them."""
+    return chord(
+        [summarize_chunk.s(job_id, chunk_object, keywords) for chunk_object in chunk_objects]
+    )(reduce_chunk_summaries.s(job_id, user_id, keywords, chunk_objects))
+
+@app.task(bind=True, max_retries=3)
+def process_full_analysis(self, job_id: str, analysis_id: int, source_object: str, file_type: str,
+                          user_id: int, corr_k: int, corr_threshold: float, corr_method: str,
+                          sheet: Optional[str] = None):
+    """Run the full analysis behind a preview and make it the current version of that analysis."""
+    try:
+        # Copied to a spooled temp file in blocks; stream mode then reads it chunk by chunk
+        source = minio_service.download_stream(source_object)
+        if source is None:
+            raise ValueError("Uploaded dataset not found in storage")
+        with source:
+            source.seek(0, 2)
+            stream = source.tell() > settings.ANALYSIS_MAX_BYTES
+            source.seek(0)
+            result, profile_bytes, _, dataset_file = analysis_service.analyze_source(
+                source, file_type, stream, corr_k, corr_threshold, corr_method, sheet
+            )
+        
         with Session(sync_engine) as db:
+            db_file = db.get(FileModel, analysis_id)
+            if db_file is None:
+                raise ValueError(f"Analysis {analysis_id} no longer exists")
+            object_name, json_size = analysis_service.store_analysis(
+                result, profile_bytes, db_file.filename, user_id, dataset_file
+            )
+            # The preview stays available as the previous version; cached copies of it are stale
+            db.execute(delete(AnalysisCache).where(AnalysisCache.file_id == db_file.id))
+            db.add(FileVersion(file_id=db_file.id, version=db_file.version or 1, object_name=db_file.object_name))
+            db_file.object_name = object_name
+            db_file.version = (db_file.version or 1) + 1
+            db_file.size_bytes = json_size
             job = db.get(Job, job_id)
             if job:
-                job.status = JobStatus.FAILED
-                job.error_message = str(exc)
-                db.commit()
+                job.status = JobStatus.COMPLETED
+                job.result_url = minio_service.get_presigned_url(object_name)
+            db.commit()
         
+        minio_service.delete_file(source_object)
+        return {"job_id": job_id, "analysis_id": analysis_id, "status": "completed"}
+    except Exception as exc:
+        _fail_job(job_id, exc)
+        raise self.retry(exc=exc, countdown=5)
+
+@app.task(bind=True, max_retries=3)
+def render_analysis_chart(self, job_id: str, chart: Dict[str, Any]) -> str:
+    """Render one chart and upload it to the object name its placeholder URL points at."""
+    try:
+        png = analysis_service.render_chart(chart["kind"], chart["data"])
+        return minio_service.upload_file(
+            filename=chart["object_name"].rsplit("/", 1)[-1],
+            file_content=png,
+            metadata={'type': 'analysis_chart'},
+            object_name=chart["object_name"]
+        )
+    except Exception as exc:
+        _fail_job(job_id, exc)
         raise self.retry(exc=exc, countdown=5)
+
+@app.task
+def finish_analysis_charts(object_names: List[str], job_id: str):
+    with Session(sync_engine) as db:
+        job = db.get(Job, job_id)
+        if job:
+            job.status = JobStatus.COMPLETED
+            db.commit()
+    return {"job_id": job_id, "charts": object_names, "status": "completed"}
+
+def queue_chart_rendering(job_id: str, charts: List[Dict[str, Any]]):
+    """Render charts in parallel on the workers and mark the job done when all are uploaded."""
+    return chord(
+        [render_analysis_chart.s(job_id, analysis_service.chart_payload(chart)) for chart in charts]
+    )(finish_analysis_charts.s(job_id))
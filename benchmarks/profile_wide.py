@@ -0,0 +1,38 @@
+"""Core-scaling benchmark for wide-table profiling.
+
+    python -m benchmarks.profile_wide --rows 100000 --cols 2000 --workers 1 2 4 8
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.services.profiling_service import profiling_service, shutdown_pool
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--cols", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.standard_normal((args.rows, args.cols)),
+                      columns=[f"c{i}" for i in range(args.cols)])
+    cols = df.columns.tolist()
+
+    settings.ANALYSIS_PARALLEL_MIN_CELLS = 0
+    baseline = None
+    for workers in args.workers:
+        shutdown_pool()
+        settings.ANALYSIS_PROFILE_WORKERS = workers
+        profiling_service.numeric_stats(df.iloc[:10], cols)  # start the pool outside the timing
+        start = time.perf_counter()
+        profiling_service.numeric_stats(df, cols)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3d} {elapsed:8.3f}s  speedup={baseline / elapsed:5.2f}x")
+    shutdown_pool()
+
+if __name__ == "__main__":
+    main()
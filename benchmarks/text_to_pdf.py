@@ -0,0 +1,46 @@
+"""Throughput benchmark for the text-to-PDF engine.
+
+    python -m benchmarks.text_to_pdf --mb 10 --runs 3
+    python -m benchmarks.text_to_pdf --mb 10 --unicode
+"""
+import argparse
+import random
+import time
+from app.services.pdf_service import pdf_service
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+         "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua"]
+UNICODE_WORDS = ["привет", "мир", "καλημέρα", "κόσμε", "数据", "分析", "“quoted”", "naïve", "façade"]
+
+def make_text(size_bytes: int, unicode: bool) -> str:
+    rng = random.Random(0)
+    vocabulary = WORDS + (UNICODE_WORDS if unicode else [])
+    lines, size = [], 0
+    while size < size_bytes:
+        # Mostly short lines, some paragraphs long enough to wrap several times
+        n = rng.choice([0, 6, 10, 14, 60, 200])
+        line = " ".join(rng.choice(vocabulary) for _ in range(n))
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=10)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--unicode", action="store_true", help="mix in non-Latin-1 words (embedded font)")
+    args = parser.parse_args()
+
+    data = make_text(int(args.mb * 1024 * 1024), args.unicode).encode("utf-8")
+    mb = len(data) / (1024 * 1024)
+    best = None
+    for run in range(args.runs):
+        start = time.perf_counter()
+        pdf = pdf_service.text_to_pdf(data)
+        elapsed = time.perf_counter() - start
+        best = min(best or elapsed, elapsed)
+        print(f"run={run}  {elapsed:7.2f}s  {mb / elapsed:6.2f} MB/s  pdf={len(pdf) / 1024 / 1024:.1f} MB")
+    print(f"best {best:.2f}s for {mb:.1f} MB of text ({mb / best:.2f} MB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import gzip
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from PIL import Image
+
+from app.services.conversion_service import conversion_service
+
+CSV = b"id,name,price\n1,apple,1.5\n2,pear,\n3,plum,2.25\n"
+
+def _compressed(fmt):
+    if fmt == "csv.gz":
+        return gzip.compress(CSV)
+    sink = pa.BufferOutputStream()
+    with pa.output_stream(sink, compression="zstd") as out:
+        out.write(CSV)
+    return sink.getvalue().to_pybytes()
+
+def _read(output, fmt):
+    if fmt == "parquet":
+        return pq.read_table(output).to_pandas()
+    return pa.ipc.open_file(output).read_all().to_pandas()
+
+@pytest.mark.parametrize("source_fmt", ["csv.gz", "csv.zst"])
+@pytest.mark.parametrize("target_fmt", ["parquet", "feather", "arrow"])
+def test_compressed_csv_to_columnar(source_fmt, target_fmt):
+    source = BytesIO(_compressed(source_fmt))
+    output = conversion_service.convert_stream(source, source_fmt, target_fmt)
+    with output:
+        df = _read(output, target_fmt)
+    assert not source.closed
+    expected = pd.read_csv(BytesIO(CSV))
+    assert df["id"].tolist() == expected["id"].tolist()
+    assert df["name"].tolist() == expected["name"].tolist()
+    assert df["price"].tolist()[::2] == expected["price"].tolist()[::2]
+    assert pd.isna(df["price"][1])
+
+@pytest.mark.parametrize("target_fmt", ["png", "tiff", "jpg"])
+def test_resize_16bit_grayscale_png(target_fmt):
+    values = (np.arange(400 * 300).reshape(300, 400) * 7 % 65536).astype(np.uint16)
+    source = BytesIO()
+    Image.fromarray(values).save(source, format="PNG")
+    converted = conversion_service.transcode_image(source.getvalue(), target_fmt, max_dimension=100)
+    with Image.open(BytesIO(converted)) as img:
+        assert img.size == (100, 75)
+        if target_fmt != "jpg":
+            assert img.mode.startswith("I")
+            assert np.asarray(img).max() > 255  # still 16-bit, not clipped to 8
+
+@pytest.mark.parametrize("target_fmt", ["tiff", "webp", "png"])
+def test_palette_transparency_kept(target_fmt):
+    img = Image.new("P", (4, 4), 1)
+    img.putpalette([255, 0, 0, 0, 0, 255] + [0] * 762)
+    img.putpixel((0, 0), 0)
+    source = BytesIO()
+    img.save(source, format="GIF", transparency=0)
+    converted = conversion_service.transcode_image(source.getvalue(), target_fmt)
+    with Image.open(BytesIO(converted)) as out:
+        rgba = out.convert("RGBA")
+        assert rgba.getpixel((0, 0))[3] == 0
+        assert rgba.getpixel((1, 1))[3] == 255